@@ -0,0 +1,302 @@
+"""
+End-to-end benchmark of the block export. Generates synthetic block scenes and runs them through BlockExport
+with stand-in executables (see standin_tool.py) in place of the Havok tools and MwmBuilder:
+
+    blender --background --factory-startup --python src/benchmark/bench_export.py -- [options]
+
+Reports the throughput in models per minute and the time spent in each stage of the export.
+Use --help to see the parameters of the generated scenes and tools.
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import bpy
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), 'python')
+ADDON = 'space_engineers'
+
+if not ADDON_DIR in sys.path:
+    sys.path.insert(0, ADDON_DIR)
+
+# layers of the default export node-tree, see default_nodes.createDefaultTree()
+LAYER_MAIN = 0
+LAYER_COLLISION = 1
+LAYERS_LOD = [5, 6, 7]
+LAYERS_CONSTR = [10, 11, 12]
+
+def argumentParser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="blender --background --factory-startup --python bench_export.py --",
+        description="Benchmarks the block export with synthetic scenes and stand-in tools.")
+    parser.add_argument('--blocks', type=int, default=4, help="number of block scenes (default: 4)")
+    parser.add_argument('--objects', type=int, default=5, help="mesh objects per model (default: 5)")
+    parser.add_argument('--polys', type=int, default=1000, help="polygons per mesh object (default: 1000)")
+    parser.add_argument('--materials', type=int, default=3, help="materials per block (default: 3)")
+    parser.add_argument('--lods', type=int, default=2, choices=range(len(LAYERS_LOD) + 1),
+                        help="level-of-detail models per block (default: 2)")
+    parser.add_argument('--constr', type=int, default=3, choices=range(len(LAYERS_CONSTR) + 1),
+                        help="construction phases per block (default: 3)")
+    parser.add_argument('--no-collision', action='store_true', help="generate no collision objects")
+    parser.add_argument('--block-size', default='SCALE_DOWN', choices=['LARGE', 'SMALL', 'SCALE_DOWN'],
+                        help="cube-sizes to export (default: SCALE_DOWN, which exports both)")
+    parser.add_argument('--latency', type=float, default=0.5, help="seconds each stand-in tool takes (default: 0.5)")
+    parser.add_argument('--mwmbuilder-latency', type=float,
+                        help="seconds the MwmBuilder stand-in takes (default: --latency)")
+    parser.add_argument('--log-lines', type=int, default=50, help="log lines each stand-in tool prints (default: 50)")
+    parser.add_argument('--jobs', type=int, default=4, help="parallel tool processes (default: 4)")
+    parser.add_argument('--batch', type=int, default=1, help="models per run of MwmBuilder (default: 1)")
+    parser.add_argument('--tool-host', metavar='HOST:PORT',
+                        help="start toolhost.py on HOST:PORT and run the stand-in tools through it")
+    parser.add_argument('--repeat', type=int, default=3, help="number of measured export runs (default: 3)")
+    parser.add_argument('--workdir', help="directory for the generated files (default: a temporary directory)")
+    parser.add_argument('--json', metavar='FILE', help="also write the results as JSON to FILE")
+    parser.add_argument('--trace', metavar='FILE', help="write a Chrome trace of the last run to FILE")
+    return parser
+
+def scriptArguments() -> list:
+    try:
+        return sys.argv[sys.argv.index('--') + 1:]
+    except ValueError:
+        return []
+
+# ---------------------------------------------- stand-in tools ---------------------------------------------- #
+
+def pythonExecutable() -> str:
+    # in Blender 2.7x sys.executable is Blender itself
+    return getattr(bpy.app, 'binary_path_python', None) or sys.executable
+
+def createStandInTool(toolDir: str, name: str, tool: str, latency: float, logLines: int) -> str:
+    command = '"%s" "%s" --latency %f --log-lines %d %s' % (
+        pythonExecutable(), os.path.join(BENCHMARK_DIR, 'standin_tool.py'), latency, logLines, tool)
+
+    if os.name == 'nt':
+        path = os.path.join(toolDir, name + '.cmd')
+        content = '@%s %%*\r\n' % command
+    else:
+        path = os.path.join(toolDir, name)
+        content = '#!/bin/sh\nexec %s "$@"\n' % command
+
+    with open(path, 'w', newline='') as f:
+        f.write(content)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+def configureStandInTools(workdir: str, args):
+    toolDir = os.path.join(workdir, 'tools')
+    os.makedirs(toolDir, exist_ok=True)
+
+    mwmbuilderLatency = args.latency if args.mwmbuilder_latency is None else args.mwmbuilder_latency
+    prefs = bpy.context.user_preferences.addons[ADDON].preferences
+    prefs.havokFbxImporter = createStandInTool(toolDir, 'FBXImporter', 'fbximporter', args.latency, args.log_lines)
+    prefs.havokFilterMgr = createStandInTool(toolDir, 'hctStandAloneFilterManager', 'filtermgr', args.latency, args.log_lines)
+    prefs.mwmbuilder = createStandInTool(toolDir, 'MwmBuilder', 'mwmbuilder', mwmbuilderLatency, args.log_lines)
+    prefs.tool_processes = args.jobs
+    prefs.mwmbuilder_batch_size = args.batch
+    prefs.tool_host = args.tool_host or ''
+    # results from the cache would be measured as the throughput of the tools
+    prefs.use_collision_cache = False
+    prefs.use_tool_cache = False
+
+def startToolHost(address: str) -> subprocess.Popen:
+    host = subprocess.Popen([pythonExecutable(), os.path.join(ADDON_DIR, ADDON, 'toolhost.py'), '--listen', address],
+                            stdout=subprocess.PIPE)
+    host.stdout.readline() # announces that it's listening
+    return host
+
+# ---------------------------------------------- synthetic scenes ---------------------------------------------- #
+
+def onLayer(index: int) -> list:
+    return [i == index for i in range(20)]
+
+def createGridMesh(name: str, polys: int) -> bpy.types.Mesh:
+    size = max(1, int(math.ceil(math.sqrt(polys))))
+    verts = [(x / size - 0.5, y / size - 0.5, 0.0) for y in range(size + 1) for x in range(size + 1)]
+    faces = [(y * (size + 1) + x, y * (size + 1) + x + 1, (y + 1) * (size + 1) + x + 1, (y + 1) * (size + 1) + x)
+             for y in range(size) for x in range(size)]
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata(verts, [], faces)
+    mesh.uv_textures.new()
+    mesh.update()
+    return mesh
+
+def createMeshObject(scene, name: str, mesh, layer: int, location=(0.0, 0.0, 0.0)) -> bpy.types.Object:
+    ob = bpy.data.objects.new(name, mesh)
+    ob.location = location
+    scene.objects.link(ob)
+    ob.layers = onLayer(layer)
+    return ob
+
+def createBlockScene(index: int, args, materials) -> bpy.types.Scene:
+    from space_engineers.types import data
+
+    scene = bpy.data.scenes.new("Bench%02d" % index)
+    d = data(scene)
+    d.is_block = True
+    d.block_size = args.block_size
+    d.export_path = '//Models'
+
+    modelLayers = [(LAYER_MAIN, args.polys)]
+    modelLayers += [(layer, max(1, args.polys >> (i + 1))) for i, layer in enumerate(LAYERS_LOD[:args.lods])]
+    modelLayers += [(layer, args.polys) for layer in LAYERS_CONSTR[:args.constr]]
+
+    for layer, polys in modelLayers:
+        for i in range(args.objects):
+            mesh = createGridMesh("%s.L%02d.%03d" % (scene.name, layer, i), polys)
+            for m in range(len(materials)):
+                mesh.materials.append(materials[(i + m) % len(materials)])
+            for p, poly in enumerate(mesh.polygons):
+                poly.material_index = p % len(materials)
+            createMeshObject(scene, mesh.name, mesh, layer, (0.0, 0.0, i * 0.01))
+
+    if not args.no_collision:
+        mesh = createGridMesh("%s.Collision" % scene.name, 6)
+        ob = createMeshObject(scene, mesh.name, mesh, LAYER_COLLISION)
+        bpy.ops.rigidbody.object_add({'scene': scene, 'object': ob, 'active_object': ob})
+        ob.rigid_body.collision_shape = 'BOX'
+
+    return scene
+
+def createBenchmarkFile(workdir: str, args) -> list:
+    from space_engineers.nodes import BlockExportTree
+    from space_engineers.default_nodes import createDefaultTree
+
+    tree = bpy.data.node_groups.new('MwmExport', BlockExportTree.bl_idname)
+    createDefaultTree(tree)
+
+    materials = [bpy.data.materials.new("BenchMaterial%02d" % i) for i in range(max(1, args.materials))]
+    scenes = [createBlockScene(i, args, materials) for i in range(args.blocks)]
+
+    bpy.ops.wm.save_as_mainfile(filepath=os.path.join(workdir, 'bench.blend'))
+    return [s.name for s in scenes]
+
+# ---------------------------------------------- measurement ---------------------------------------------- #
+
+class CountingOperator:
+    """Counts the reported messages by level and only prints the errors."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def report(self, type, message):
+        level = next(iter(type))
+        self.counts[level] = self.counts.get(level, 0) + 1
+        if level == 'ERROR':
+            print("ERROR: %s" % message, file=sys.stderr)
+
+def countModels(outputDir: str) -> int:
+    try:
+        return sum(1 for f in os.listdir(outputDir) if f.endswith('.mwm'))
+    except FileNotFoundError:
+        return 0
+
+def exportRun(sceneNames, args):
+    from tempfile import TemporaryDirectory
+    from space_engineers.export import ExportSettings, ToolRunner
+    from space_engineers.operators import BlockExport
+    from space_engineers.tracing import Tracer
+
+    outputDir = bpy.path.abspath('//Models')
+    shutil.rmtree(outputDir, ignore_errors=True)
+
+    reporter = CountingOperator()
+    tracer = Tracer()
+
+    start = time.perf_counter()
+    with TemporaryDirectory() as tmpDir, ToolRunner(args.jobs) as toolRunner:
+        for name in sceneNames:
+            settings = ExportSettings(bpy.data.scenes[name], mwmDir=tmpDir)
+            settings.operator = reporter
+            settings.toolRunner = toolRunner
+            settings.tracer = tracer
+            with tracer.span('export scene', 'benchmark', scene=name):
+                BlockExport(settings).export()
+    elapsed = time.perf_counter() - start
+
+    return elapsed, countModels(outputDir), reporter.counts, tracer
+
+def stageTimings(tracers) -> OrderedDict:
+    stages = {}
+    for tracer in tracers:
+        for event in tracer.events:
+            if event.get('ph', None) != 'X' or event.get('cat', None) == 'node':
+                continue
+            stages.setdefault(event['name'], []).append(event['dur'] / 1e6)
+
+    return OrderedDict((name, {
+        'count': len(durations),
+        'total': sum(durations),
+        'mean': sum(durations) / len(durations),
+        'max': max(durations),
+    }) for name, durations in sorted(stages.items(), key=lambda item: -sum(item[1])))
+
+def printReport(runs, stages):
+    print()
+    print("%-6s %10s %8s %14s" % ("run", "seconds", "models", "models/minute"))
+    for i, run in enumerate(runs):
+        print("%-6d %10.2f %8d %14.1f" % (i + 1, run['seconds'], run['models'], run['modelsPerMinute']))
+
+    print()
+    print("%-22s %8s %10s %10s %10s" % ("stage", "count", "total s", "mean ms", "max ms"))
+    for name, t in stages.items():
+        print("%-22s %8d %10.2f %10.1f %10.1f" % (name, t['count'], t['total'], t['mean'] * 1000, t['max'] * 1000))
+
+def main():
+    args = argumentParser().parse_args(scriptArguments())
+
+    import addon_utils
+    if addon_utils.enable(ADDON, default_set=True) is None:
+        print("could not enable the add-on from %s" % ADDON_DIR, file=sys.stderr)
+        sys.exit(2)
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='se_bench_')
+    os.makedirs(workdir, exist_ok=True)
+
+    configureStandInTools(workdir, args)
+    sceneNames = createBenchmarkFile(workdir, args)
+    toolHost = startToolHost(args.tool_host) if args.tool_host else None
+
+    runs = []
+    tracers = []
+    try:
+        for i in range(args.repeat):
+            elapsed, models, counts, tracer = exportRun(sceneNames, args)
+            runs.append({
+                'seconds': elapsed,
+                'models': models,
+                'modelsPerMinute': models / elapsed * 60 if elapsed > 0 else 0.0,
+                'messages': counts,
+            })
+            tracers.append(tracer)
+    finally:
+        if toolHost:
+            toolHost.kill()
+            toolHost.wait()
+
+    stages = stageTimings(tracers)
+    printReport(runs, stages)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'parameters': vars(args), 'runs': runs, 'stages': stages}, f, indent=1)
+    if args.trace and tracers:
+        tracers[-1].write(args.trace)
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    failed = any(run['messages'].get('ERROR', 0) for run in runs)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
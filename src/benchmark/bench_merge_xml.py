@@ -0,0 +1,133 @@
+"""
+Benchmark of parsing and writing CubeBlocks.sbc files. Compares the optimized XMLParser that merge_xml uses where
+it keeps comments and the order of attributes with the pure-Python AttributeOrderPreservingParser and checks that
+both produce byte-identical files with the 'ordered-attribs' method:
+
+    blender --background --factory-startup --python src/benchmark/bench_merge_xml.py -- [options] [file.sbc ...]
+
+Without files a synthetic CubeBlocks.sbc with --definitions block-definitions is used. Written back it also has to
+come out byte-identical to the original, otherwise the benchmark fails.
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from xml.etree import ElementTree as ET
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), 'python')
+
+if not ADDON_DIR in sys.path:
+    sys.path.insert(0, ADDON_DIR)
+
+from space_engineers.merge_xml import AttributeOrderPreservingParser, CommentableTreeBuilder, ordered_xml_parser, \
+    _FAST_PARSER_PRESERVES_ORDER
+
+DEFINITION = """\
+    <!-- generated block %(n)d -->
+    <Definition xsi:type="MyObjectBuilder_CubeBlockDefinition">
+      <Id>
+        <TypeId>CubeBlock</TypeId>
+        <SubtypeId>Bench_Block_%(n)d</SubtypeId>
+      </Id>
+      <DisplayName>Benchmark Block %(n)d &amp; friends</DisplayName>
+      <Icon>Textures\\Icons\\bench_%(n)d.dds</Icon>
+      <CubeSize>Large</CubeSize>
+      <BlockTopology>TriangleMesh</BlockTopology>
+      <Size x="1" y="2" z="3" />
+      <ModelOffset x="0" y="0" z="0" />
+      <Model>Models\\Bench\\Block_%(n)d.mwm</Model>
+      <Components>
+        <Component Subtype="SteelPlate" Count="%(n)d" />
+        <Component Subtype="Construction" Count="4" />
+      </Components>
+      <CriticalComponent Subtype="SteelPlate" Index="0" />
+      <MountPoints>
+        <MountPoint Side="Front" StartX="0.00" StartY="0.00" EndX="1.00" EndY="2.00" />
+        <MountPoint Side="Back" StartX="0.00" StartY="0.00" EndX="1.00" EndY="2.00" />
+      </MountPoints>
+      <BuildProgressModels>
+        <Model BuildPercentUpperBound="0.50" File="Models\\Bench\\Block_%(n)d_Constr1.mwm" />
+        <Model BuildPercentUpperBound="1.00" File="Models\\Bench\\Block_%(n)d_Constr2.mwm" />
+      </BuildProgressModels>
+      <BlockPairName>Bench_Block_%(n)d</BlockPairName>
+      <BuildTimeSeconds>10</BuildTimeSeconds>
+    </Definition>
+"""
+
+def syntheticCubeBlocks(path: str, definitions: int):
+    # written the way ElementTree writes it, so that a round-trip has to reproduce it exactly
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        f.write('<Definitions xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n  <CubeBlocks>\n')
+        for n in range(definitions):
+            f.write(DEFINITION % {'n': n})
+        f.write('  </CubeBlocks>\n</Definitions>')
+
+def slowParser():
+    return AttributeOrderPreservingParser(target=CommentableTreeBuilder())
+
+def serialize(tree: ET.ElementTree) -> bytes:
+    content = io.BytesIO()
+    tree.write(content, encoding="utf-8", xml_declaration=False, method="ordered-attribs")
+    return content.getvalue()
+
+def best(repeat: int, action) -> tuple:
+    bestTime = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = action()
+        elapsed = time.perf_counter() - start
+        bestTime = elapsed if bestTime is None else min(bestTime, elapsed)
+    return bestTime, result
+
+def scriptArguments() -> list:
+    try:
+        return sys.argv[sys.argv.index('--') + 1:]
+    except ValueError:
+        return []
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="blender --background --factory-startup --python bench_merge_xml.py --",
+        description="Benchmarks parsing and writing CubeBlocks.sbc files.")
+    parser.add_argument('--definitions', type=int, default=5000,
+                        help="block-definitions in the synthetic file (default: 5000)")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per parser, the best is reported (default: 3)")
+    parser.add_argument('files', nargs='*', help=".sbc files to use instead of the synthetic one")
+    args = parser.parse_args(scriptArguments())
+
+    if not _FAST_PARSER_PRESERVES_ORDER:
+        print("Python %d.%d: the optimized parser doesn't keep comments here, merge_xml uses the pure-Python one."
+              % sys.version_info[:2])
+
+    with tempfile.TemporaryDirectory(prefix='bench_merge_xml_') as tmpDir:
+        files = args.files
+        synthetic = not files
+        if synthetic:
+            files = [os.path.join(tmpDir, 'CubeBlocks.sbc')]
+            syntheticCubeBlocks(files[0], args.definitions)
+
+        identical = True
+        for path in files:
+            slow, slowTree = best(args.repeat, lambda: ET.parse(path, parser=slowParser()))
+            fast, fastTree = best(args.repeat, lambda: ET.parse(path, parser=ordered_xml_parser()))
+            write, slowContent = best(args.repeat, lambda: serialize(slowTree))
+            same = slowContent == serialize(fastTree)
+            identical = identical and same
+            with open(path, 'rb') as f:
+                roundTrip = slowContent == f.read()
+            if synthetic:
+                identical = identical and roundTrip
+            print("%s (%.1f MB): parsing pure-Python %.3fs, ordered_xml_parser() %.3fs (%.1fx faster), "
+                  "writing %.3fs, output %s, round-trip %s" % (
+                os.path.basename(path), os.path.getsize(path) / 2**20, slow, fast, slow / fast, write,
+                "identical" if same else "DIFFERENT", "identical" if roundTrip else "differs"))
+
+    sys.exit(0 if identical else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Stands in for the Havok FBX Importer, the Havok Standalone Filter Manager and MwmBuilder so that the export
+pipeline can be benchmarked without the Windows tools. It accepts the same command-lines the add-on uses,
+produces the expected output files from the inputs and takes the configured time to do so.
+
+    python standin_tool.py [--latency SECONDS] [--log-lines N] (fbximporter|filtermgr|mwmbuilder) <tool arguments>
+
+bench_export.py generates small wrapper executables that call this script with a fixed tool and configuration.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time
+
+def emitLog(tool: str, lines: int):
+    for i in range(lines):
+        print("%s: INFO: stand-in progress %d/%d" % (tool, i + 1, lines))
+
+def fbximporter(args):
+    # <tool> <srcfile.fbx> <dstfile.hkt>
+    srcfile, dstfile = args[0], args[1]
+    shutil.copyfile(srcfile, dstfile)
+
+def filtermgr(args):
+    # <tool> -t -s <options.hko> -p <dstfile> <srcfile>
+    dstfile = args[args.index('-p') + 1]
+    srcfile = args[-1]
+    if os.path.abspath(srcfile) != os.path.abspath(dstfile):
+        shutil.copyfile(srcfile, dstfile)
+
+def mwmbuilder(args):
+    # <tool> /s:<sourcedir> [/m:<model.fbx>] /o:<outputdir>, relative to the working directory
+    # without /m: every model in the source directory is converted
+    options = dict((a[1], a[3:]) for a in args if a.startswith('/') and a[2:3] == ':')
+    sourceDir = options.get('s', 'Content')
+    outputDir = options.get('o', '.').replace('\\', os.sep) or '.'
+    if 'm' in options:
+        models = [os.path.splitext(options['m'])[0]]
+    else:
+        models = sorted(os.path.splitext(f)[0] for f in os.listdir(sourceDir) if f.lower().endswith('.fbx'))
+
+    for model in models:
+        print("mwmbuilder: INFO: converting %s.fbx" % model)
+        with open(os.path.join(outputDir, model + '.mwm'), 'wb') as mwm:
+            for ext in ('.fbx', '.xml', '.hkt'):
+                inputFile = os.path.join(sourceDir, model + ext)
+                if os.path.isfile(inputFile):
+                    with open(inputFile, 'rb') as f:
+                        shutil.copyfileobj(f, mwm)
+
+TOOLS = {
+    'fbximporter': fbximporter,
+    'filtermgr': filtermgr,
+    'mwmbuilder': mwmbuilder,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in for the external tools of the export.")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the tool takes in addition to its work")
+    parser.add_argument('--log-lines', type=int, default=0, help="number of log lines the tool prints")
+    parser.add_argument('tool', choices=sorted(TOOLS.keys()))
+    parser.add_argument('arguments', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    TOOLS[args.tool](args.arguments)
+    emitLog(args.tool, args.log_lines)
+
+    remaining = args.latency - (time.perf_counter() - start)
+    if remaining > 0:
+        time.sleep(remaining)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -32,10 +32,18 @@ if not reload('mwmbuilder'): from . import mwmbuilder
 if not reload('fbx'): from . import fbx
 if not reload('havok_options'): from . import havok_options
 if not reload('merge_xml'): from . import merge_xml
+if not reload('mesh_cache'): from . import mesh_cache
+if not reload('manifest'): from . import manifest
+if not reload('tracing'): from . import tracing
+if not reload('staging'): from . import staging
+if not reload('artifact_cache'): from . import artifact_cache
+if not reload('toolhost'): from . import toolhost
 if not reload('export'): from . import export
 if not reload('nodes'): from . import nodes
 if not reload('default_nodes'): from . import nodes
+if not reload('scheduler'): from . import scheduler
 if not reload('operators'): from . import operators
+if not reload('batch'): from . import batch
 if not reload('versions'): from . import versions
 
 del modules
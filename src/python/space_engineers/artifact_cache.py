@@ -0,0 +1,111 @@
+import os
+import tempfile
+import bpy
+from .staging import stage_file
+
+def default_cache_dir() -> str:
+    return bpy.utils.user_resource('DATAFILES', path='space_engineers_cache')
+
+def cache_dir() -> str:
+    """
+    The cache directory from the add-on preferences or, if none is configured, default_cache_dir().
+    """
+    from .types import prefs
+    cacheDir = prefs().cache_dir
+    return os.path.normpath(bpy.path.abspath(cacheDir)) if cacheDir else default_cache_dir()
+
+def prune_cache_dir(directory: str, maxSize: int) -> int:
+    """
+    Removes the least recently used entries of all caches in directory until their files take up
+    at most maxSize bytes. The files of an entry share its key as their name and are removed together.
+    Returns the number of removed entries.
+    """
+    entries = {} # (dirpath, key) -> [size, last use, [filenames]]
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.startswith('.'):
+                continue # written right now by someone
+            try:
+                stat = os.stat(os.path.join(dirpath, filename))
+            except OSError:
+                continue
+            entry = entries.setdefault((dirpath, filename.split('.', 1)[0]), [0, 0.0, []])
+            entry[0] += stat.st_size
+            entry[1] = max(entry[1], stat.st_mtime)
+            entry[2].append(filename)
+            total += stat.st_size
+
+    removed = 0
+    for (dirpath, key), (size, lastUse, filenames) in sorted(entries.items(), key=lambda e: e[1][1]):
+        if total <= maxSize:
+            break
+        # the marker of a complete entry goes first, so nobody uses what is left of it
+        for filename in sorted(filenames, key=lambda f: not f.endswith('.done')):
+            try:
+                os.remove(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+        total -= size
+        removed += 1
+    return removed
+
+class ArtifactCache:
+    """
+    A directory of files that are addressed by a key derived from everything that went into producing them.
+    Files taken from the cache are independent copies (or copy-on-write clones), so the tools may later
+    overwrite them in place without corrupting the cache.
+    """
+
+    def __init__(self, directory: str, namespace: str):
+        self.directory = os.path.join(directory, namespace)
+
+    def path(self, key: str, suffix='') -> str:
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    def fetch(self, key: str, dstfile: str, suffix='') -> bool:
+        """
+        Provides the cached file for key as dstfile. Returns False if there is no such file.
+        """
+        cached = self.path(key, suffix)
+        if not os.path.isfile(cached):
+            return False
+        try:
+            stage_file(cached, dstfile, allowLink=False)
+            os.utime(cached) # the modification-time tells prune_cache_dir() when the file was used last
+            return True
+        except OSError:
+            return False # most likely removed by someone else in the meantime
+
+    def contains(self, key: str, suffix='') -> bool:
+        return os.path.isfile(self.path(key, suffix))
+
+    def put(self, key: str, srcfile: str, suffix=''):
+        """
+        Adds a copy of srcfile to the cache.
+        """
+        self._atomicPut(key, suffix, lambda tmpfile: stage_file(srcfile, tmpfile, allowLink=False))
+
+    def putBytes(self, key: str, content: bytes, suffix=''):
+        def write(tmpfile):
+            with open(tmpfile, 'wb') as f:
+                f.write(content)
+        self._atomicPut(key, suffix, write)
+
+    def _atomicPut(self, key: str, suffix: str, writeTo):
+        # concurrent exports might add the same file, so it's written under a temporary name first and then renamed
+        cached = self.path(key, suffix)
+        try:
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            fd, tmpfile = tempfile.mkstemp(prefix='.', dir=os.path.dirname(cached))
+            os.close(fd)
+        except OSError:
+            return # a cache that can't be written to just doesn't cache
+        try:
+            writeTo(tmpfile)
+            os.replace(tmpfile, cached)
+        except OSError:
+            try:
+                os.remove(tmpfile)
+            except OSError:
+                pass
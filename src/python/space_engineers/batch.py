@@ -0,0 +1,327 @@
+"""
+Exports whole mods without the user interface. Run it through Blender like this:
+
+    blender --background --python-expr "import space_engineers.batch as b; b.main()" -- [options] <.blend files or directories>
+
+Every scene that is marked as a block gets exported with the settings it would use for "Export all scenes".
+The .blend files can be distributed over several Blender processes (--jobs). The result of every scene is written
+as a JSON summary (--summary, default is stdout) and the exit code tells whether everything succeeded.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import traceback
+from subprocess import CalledProcessError
+from tempfile import TemporaryDirectory
+from xml.etree import ElementTree as ET
+import bpy
+from .export import ExportSettings, MissbehavingToolError, ToolRunner
+from .manifest import ExportManifest
+from .merge_xml import CubeBlocksPatcher, ModDefinitionsMerger, MergeResult, find_data_dir, ordered_xml_parser
+from .operators import BlockExport
+from .tracing import Tracer, NULL_TRACER, readTraceEvents
+from .types import data, prefs
+
+EXIT_SUCCESS = 0
+EXIT_FAILED = 1 # some scene or definition failed to export
+EXIT_USAGE = 2 # invalid arguments or nothing to export
+
+class CollectingOperator:
+    """
+    Takes the place of the operator that ExportSettings reports to and keeps the messages for the summary.
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def report(self, type, message):
+        level = next(iter(type))
+        self.messages.append({'level': level, 'message': message})
+        print("%7s: %s" % (level, message), file=sys.stderr)
+
+def argumentParser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="blender --background --python-expr \"import %s as b; b.main()\" --" % __name__,
+        description="Exports all scenes marked as blocks from the given .blend files.")
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+        help=".blend files or directories that are searched for .blend files")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+        help="number of Blender processes the .blend files are distributed over (default: 1)")
+    parser.add_argument('--summary', metavar='FILE',
+        help="write the JSON summary to FILE instead of stdout")
+    parser.add_argument('--update-definitions', metavar='SBC',
+        help="merge the block-definitions into the given CubeBlocks.sbc or, for a directory, "
+             "into whichever .sbc file of the mod's Data directory contains them")
+    parser.add_argument('--backup', action='store_true',
+        help="create a backup of the CubeBlocks.sbc before updating it")
+    parser.add_argument('--skip-mwmbuilder', action='store_true',
+        help="export intermediary files but do not run them through mwmbuilder")
+    parser.add_argument('--full', action='store_true',
+        help="regenerate all models, even those that did not change since the last export")
+    parser.add_argument('--trace', metavar='FILE',
+        help="record how long each stage of the export takes into FILE (Chrome trace-event format)")
+    parser.add_argument('--worker-summary', metavar='FILE', help=argparse.SUPPRESS)
+    return parser
+
+def scriptArguments() -> list:
+    """Blender passes everything after '--' on to the script."""
+    try:
+        return sys.argv[sys.argv.index('--') + 1:]
+    except ValueError:
+        return []
+
+def findBlendFiles(paths) -> list:
+    blendFiles = []
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                blendFiles.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.lower().endswith('.blend'))
+        else:
+            blendFiles.append(path)
+    return blendFiles
+
+def shard(files, count: int) -> list:
+    """
+    Distributes the files over count shards. The biggest files are placed first,
+    always into the shard with the smallest total size so far.
+    """
+    def size(f):
+        try:
+            return os.path.getsize(f)
+        except OSError:
+            return 0
+
+    shards = [[] for i in range(max(1, min(count, len(files))))]
+    loads = [0] * len(shards)
+    for f in sorted(files, key=size, reverse=True):
+        i = loads.index(min(loads))
+        shards[i].append(f)
+        loads[i] += size(f)
+    return [s for s in shards if s]
+
+def ensureAddonEnabled():
+    # the add-on's preferences hold the tool paths, they only exist if the add-on is enabled
+    if __package__ not in bpy.context.user_preferences.addons:
+        import addon_utils
+        addon_utils.enable(__package__, default_set=True)
+
+def exportScene(scene, args, tmpDir, toolRunner, tracer) -> dict:
+    reporter = CollectingOperator()
+    result = {
+        'scene': scene.name,
+        'status': 'SUCCESS',
+        'skipped': [],
+        'failed': [],
+        'problems': [],
+        'definitions': [],
+        'messages': reporter.messages,
+    }
+
+    try:
+        settings = ExportSettings(scene, mwmDir=tmpDir)
+        settings.operator = reporter
+        settings.isRunMwmbuilder = not args.skip_mwmbuilder
+        settings.toolRunner = toolRunner
+        settings.tracer = tracer
+        if not args.full:
+            settings.manifest = ExportManifest(settings.outputDir)
+
+        blockExport = BlockExport(settings)
+        result['skipped'], result['failed'], result['problems'] = blockExport.export()
+
+        if args.update_definitions:
+            blockDefs = blockExport.blockDefs()
+            if blockDefs is None:
+                result['failed'].append('Block Definition')
+            else:
+                for subtypeId, xml in blockDefs:
+                    if xml is None:
+                        result['failed'].append(subtypeId)
+                    else:
+                        result['definitions'].append(ET.tostring(xml, encoding='unicode', method='ordered-attribs'))
+
+    except KeyError as e: # the scene's export settings don't exist
+        reporter.report({'ERROR'}, "No export settings %s" % e)
+        result['status'] = 'FAILED'
+    except FileNotFoundError as e: # raised when the addon preferences are missing some tool paths
+        reporter.report({'ERROR'}, "Configuration error: %s" % e)
+        result['status'] = 'FAILED'
+    except CalledProcessError as e:
+        reporter.report({'ERROR'}, "An external tool failed, check generated logs: %s" % e)
+        result['status'] = 'FAILED'
+    except MissbehavingToolError as e:
+        reporter.report({'ERROR'}, str(e))
+        result['status'] = 'FAILED'
+    except Exception as e: # only this scene failed, the remaining ones are still exported
+        traceback.print_exc(file=sys.stderr)
+        reporter.report({'ERROR'}, "Export failed: %s" % e)
+        result['status'] = 'FAILED'
+
+    if result['failed']:
+        result['status'] = 'FAILED'
+    elif result['problems'] and result['status'] == 'SUCCESS':
+        result['status'] = 'PROBLEMS'
+    return result
+
+def exportFiles(files, args, tracer) -> list:
+    """
+    Exports all block-scenes of the given .blend files in this Blender process.
+    """
+    results = []
+
+    with TemporaryDirectory() as tmpDir, ToolRunner(prefs().tool_processes) as toolRunner:
+        for i, blendFile in enumerate(files):
+            print("[%d/%d] %s" % (i + 1, len(files), blendFile), file=sys.stderr)
+            fileResult = {'file': blendFile, 'status': 'SUCCESS', 'error': None, 'scenes': []}
+            results.append(fileResult)
+
+            try:
+                with tracer.span('open_mainfile', 'io', file=os.path.basename(blendFile)):
+                    bpy.ops.wm.open_mainfile(filepath=blendFile)
+            except RuntimeError as e:
+                fileResult['status'] = 'FAILED'
+                fileResult['error'] = str(e)
+                continue
+
+            # only object-mode has no pending changes to the meshes
+            if bpy.ops.object.mode_set.poll():
+                bpy.ops.object.mode_set(mode='OBJECT')
+
+            for scene in bpy.data.scenes:
+                if not data(scene).is_block:
+                    continue
+                sceneResult = exportScene(scene, args, tmpDir, toolRunner, tracer)
+                fileResult['scenes'].append(sceneResult)
+
+                if sceneResult['status'] == 'FAILED':
+                    fileResult['status'] = 'FAILED'
+                elif sceneResult['status'] == 'PROBLEMS' and fileResult['status'] == 'SUCCESS':
+                    fileResult['status'] = 'PROBLEMS'
+
+    return results
+
+def exportFilesInProcesses(shards, args, traceEvents: list) -> list:
+    """
+    Starts a Blender process for each shard of .blend files and collects their results.
+    The trace-events the processes recorded are added to traceEvents.
+    """
+    results = []
+
+    with TemporaryDirectory() as tmpDir:
+        processes = []
+        for i, files in enumerate(shards):
+            summaryFile = os.path.join(tmpDir, 'shard%d.json' % i)
+            traceFile = os.path.join(tmpDir, 'shard%d.trace.json' % i)
+            cmdline = [
+                bpy.app.binary_path, '--background',
+                '--python-expr', "import %s as b; b.main()" % __name__,
+                '--', '--worker-summary', summaryFile,
+            ]
+            if args.trace:
+                cmdline += ['--trace', traceFile]
+            if args.update_definitions:
+                cmdline += ['--update-definitions', args.update_definitions]
+            if args.skip_mwmbuilder:
+                cmdline.append('--skip-mwmbuilder')
+            if args.full:
+                cmdline.append('--full')
+            cmdline += files
+
+            # stdout is reserved for the summary
+            processes.append((files, summaryFile, traceFile, subprocess.Popen(cmdline, stdout=sys.stderr)))
+
+        for files, summaryFile, traceFile, process in processes:
+            returncode = process.wait()
+            traceEvents.extend(readTraceEvents(traceFile))
+            try:
+                with open(summaryFile, 'r', encoding='utf-8') as f:
+                    results.extend(json.load(f))
+            except (OSError, ValueError):
+                error = "Blender process exited with code %d without a summary" % returncode
+                results.extend({'file': f, 'status': 'FAILED', 'error': error, 'scenes': []} for f in files)
+
+    return results
+
+def updateDefinitions(cubeBlocksPath: str, fileResults, backup: bool, tracer) -> dict:
+    result = {'file': cubeBlocksPath, 'status': 'SUCCESS', 'error': None, 'updated': [], 'notFound': []}
+
+    try:
+        if os.path.isdir(cubeBlocksPath):
+            # the same files as "Update block definitions" with "Whole Mod" would update
+            merger = ModDefinitionsMerger(find_data_dir(cubeBlocksPath), backup=backup)
+            result['file'] = merger.dataDir
+            if merger.brokenFiles:
+                result['unreadable'] = merger.brokenFiles
+        else:
+            merger = CubeBlocksPatcher(cubeBlocksPath=cubeBlocksPath, backup=backup)
+    except (OSError, ValueError, ET.ParseError) as e:
+        result['status'] = 'FAILED'
+        result['error'] = str(e)
+        return result
+
+    for fileResult in fileResults:
+        for sceneResult in fileResult['scenes']:
+            for definition in sceneResult['definitions']:
+                xml = ET.XML(definition, parser=ordered_xml_parser())
+                subtypeId = xml.findtext("./Id/SubtypeId", None)
+                if MergeResult.NOT_FOUND in merger.merge(xml):
+                    result['notFound'].append(subtypeId)
+                    result['status'] = 'FAILED'
+                else:
+                    result['updated'].append(subtypeId)
+
+    with tracer.span('CubeBlocksMerger.write', 'io', file=os.path.basename(cubeBlocksPath)):
+        merger.write()
+    return result
+
+def main():
+    args = argumentParser().parse_args(scriptArguments())
+    ensureAddonEnabled()
+
+    files = findBlendFiles(args.paths)
+    tracer = Tracer() if args.trace else NULL_TRACER
+
+    if args.worker_summary:
+        results = exportFiles(files, args, tracer)
+        with open(args.worker_summary, 'w', encoding='utf-8') as f:
+            json.dump(results, f)
+        tracer.write(args.trace)
+        sys.exit(EXIT_SUCCESS)
+
+    if not files:
+        print("No .blend files found in %s" % args.paths, file=sys.stderr)
+        sys.exit(EXIT_USAGE)
+
+    shards = shard(files, args.jobs)
+    traceEvents = []
+    if len(shards) == 1:
+        results = exportFiles(files, args, tracer)
+    else:
+        results = exportFilesInProcesses(shards, args, traceEvents)
+
+    summary = {'status': 'SUCCESS', 'files': results, 'definitions': None}
+    if args.update_definitions:
+        summary['definitions'] = updateDefinitions(os.path.abspath(args.update_definitions), results, args.backup, tracer)
+    tracer.write(args.trace, traceEvents)
+
+    statuses = [r['status'] for r in results]
+    if summary['definitions']:
+        statuses.append(summary['definitions']['status'])
+    if 'FAILED' in statuses:
+        summary['status'] = 'FAILED'
+    elif 'PROBLEMS' in statuses:
+        summary['status'] = 'PROBLEMS'
+
+    if args.summary:
+        with open(args.summary, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=1)
+    else:
+        json.dump(summary, sys.stdout, indent=1)
+        print()
+
+    sys.exit(EXIT_FAILED if summary['status'] == 'FAILED' else EXIT_SUCCESS)
@@ -1,20 +1,29 @@
+import io
 import os
 import re
 import subprocess
 import tempfile
 import bpy
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock, Timer
 from os.path import basename, join
 from string import Template
 from xml.etree import ElementTree
 import shutil
 from mathutils import Matrix
 
-from .mount_points import mount_point_definitions, mount_points_xml
+from .mount_points import mount_point_definitions, mount_points_xml, coalesce_mount_points
 from .mirroring import mirroringAxisFromObjectName
 from .utils import scaleUni, md5sum
+from .manifest import Fingerprint
 from .types import data, prefs, getBaseDir, SESceneProperties
 from .fbx import save_single
+from .tracing import NULL_TRACER
+from .staging import stage_file, same_volume, write_if_changed, replace_if_changed, match_file_mode
+from .artifact_cache import ArtifactCache, cache_dir, prune_cache_dir
+from .toolhost import RemoteProcess, ToolHostError, parse_address
+from .mesh_cache import EvaluatedMeshCache, evaluated_object_data
 
 from bpy_extras.io_utils import axis_conversion, ExportHelper
 
@@ -34,6 +43,71 @@ class MissbehavingToolError(subprocess.SubprocessError):
     def __str__(self):
         return self.message
 
+class ToolTimeoutError(MissbehavingToolError):
+    def __init__(self, cmdline, timeout):
+        super().__init__("%s did not finish within %d seconds and was stopped" % (basename(cmdline[0]), timeout))
+        self.cmd = cmdline
+        self.timeout = timeout
+
+class ToolRunner:
+    """
+    Runs jobs that drive external tools on a pool of worker threads.
+    The tools are separate processes so the threads only wait for them and the jobs effectively run in parallel.
+
+    The caller produces the jobs' input files while earlier jobs are still running. To keep it from racing
+    too far ahead only a limited number of jobs can be pending at once. Further submits block until a job finished.
+    """
+
+    def __init__(self, maxWorkers: int, maxPending: int = None):
+        maxWorkers = max(1, maxWorkers)
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers)
+        self.pending = BoundedSemaphore(maxPending if maxPending else 2 * maxWorkers)
+
+    def submit(self, job, *args) -> Future:
+        self.pending.acquire()
+        try:
+            future = self.executor.submit(job, *args)
+        except:
+            self.pending.release()
+            raise
+        future.add_done_callback(lambda f: self.pending.release())
+        return future
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+class DeferredOutcome:
+    """
+    The outcome of an export-node whose external tool might still be running in the background.
+    Background jobs must not report to Blender themselves. Instead the given resolve-function is called
+    with the finished Future on Blender's main thread. It reports and returns the actual outcome.
+    """
+
+    def __init__(self, future: Future, resolve):
+        self.future = future
+        self._resolve = resolve
+        self._outcome = None
+
+    def isDone(self):
+        return self.future.done()
+
+    def result(self) -> str:
+        if self._outcome is None:
+            self._outcome = self._resolve(self.future)
+        return self._outcome
+
+def resolveOutcome(outcome) -> str:
+    """
+    Waits for a DeferredOutcome to finish. Plain outcomes are returned as they are.
+    """
+    return outcome.result() if isinstance(outcome, DeferredOutcome) else outcome
+
 def tool_path(propertyName, displayName, toolPath=None):
     if None == toolPath:
         toolPath = getattr(bpy.context.user_preferences.addons['space_engineers'].preferences, propertyName)
@@ -47,20 +121,35 @@ def tool_path(propertyName, displayName, toolPath=None):
 
     return toolPath
 
-def write_to_log(logfile, content, cmdline=None, cwd=None, loglines=[]):
-    with open(logfile, 'wb') as log:
-        if cwd:
-            str = "Running from: %s \n" % (cwd)
-            log.write(str.encode('utf-8'))
+_toolDigests = {}
+
+def tool_digest(toolPath: str) -> str:
+    """
+    The md5 of the tool's executable. Only calculated again if the file's size or modification time changes.
+    """
+    stat = os.stat(toolPath)
+    key = (toolPath, stat.st_size, stat.st_mtime)
+    digest = _toolDigests.get(key, None)
+    if digest is None:
+        digest = _toolDigests[key] = md5sum(toolPath)
+    return digest
+
+def write_log_header(log, cmdline=None, cwd=None, loglines=[]):
+    if cwd:
+        str = "Running from: %s \n" % (cwd)
+        log.write(str.encode('utf-8'))
 
-        if cmdline:
-            str = "Command: %s \n" % (" ".join(cmdline))
-            log.write(str.encode('utf-8'))
+    if cmdline:
+        str = "Command: %s \n" % (" ".join(cmdline))
+        log.write(str.encode('utf-8'))
 
-        for line in loglines:
-            log.write(line.encode('utf-8'))
-            log.write(b"\n")
+    for line in loglines:
+        log.write(line.encode('utf-8'))
+        log.write(b"\n")
 
+def write_to_log(logfile, content, cmdline=None, cwd=None, loglines=[]):
+    with open(logfile, 'wb') as log:
+        write_log_header(log, cmdline=cmdline, cwd=cwd, loglines=loglines)
         log.write(content)
 
 def pretty_xml(elem: ElementTree.Element, level=0, indent="\t"):
@@ -78,10 +167,15 @@ def pretty_xml(elem: ElementTree.Element, level=0, indent="\t"):
         if level and (not elem.tail or not elem.tail.strip()):
             elem.tail = i
 
-def write_pretty_xml(elem: ElementTree.Element, filepath: str):
+def write_pretty_xml(elem: ElementTree.Element, filepath: str) -> bool:
+    """
+    Writes the element unless the file already has the same content. Returns whether the file was written.
+    """
     pretty_xml(elem, indent="\t")
+    content = io.BytesIO()
     ElementTree.ElementTree(elem).write(
-        filepath, encoding="utf-8", xml_declaration=False, method="ordered-attribs")
+        content, encoding="utf-8", xml_declaration=False, method="ordered-attribs")
+    return write_if_changed(filepath, content.getvalue())
 
 class Names:
     subtypeid = '${BlockPairName}_${CubeSize}'
@@ -114,6 +208,15 @@ class ExportSettings:
         self.isLogToolOutput = True
         self.isRunMwmbuilder = True
         self.isFixDirBug = prefs().fix_dir_bug
+        # seconds after which a hanging tool gets stopped, None waits forever
+        self.havokTimeout = prefs().havok_timeout or None
+        self.mwmbuilderTimeout = prefs().mwmbuilder_timeout or None
+        # bytes of tool output that are written to a log-file, None writes everything
+        self.maxLogSize = prefs().max_log_size * 1024 * 1024 or None
+        # runs external tools in parallel, see ToolRunner. None runs them immediately on the calling thread.
+        self.toolRunner = None
+        # host:port of a long-running process that starts the tools, see .toolhost. None starts them directly.
+        self.toolHost = prefs().tool_host.strip() or None
         self.names = Names()
         self.isUseTangentSpace = False
         # set on first access, see properties below
@@ -140,6 +243,24 @@ class ExportSettings:
         self.SubtypeId = None # corresponds with element-name in CubeBlocks.sbc
 
         self.cache = {}
+        # how many written files turned out to have the same content as before and were left alone
+        self.unchangedFiles = 0
+        self._unchangedLock = Lock() # counted from the tool runner's threads, too
+        # meshes of objects with their modifiers applied, shared by all nodes and cube-sizes of an export
+        self.meshes = EvaluatedMeshCache(prefs().mesh_cache_size * 1024 * 1024)
+        # .fbx files of the large block by MwmFileNode, reused when scaling down. not cleared between cube-sizes.
+        self.largeFbxFiles = {}
+        # remembers what previous exports produced, see .manifest.ExportManifest. None disables incremental exports.
+        self.manifest = None
+        # records the duration of the export stages, see .tracing.Tracer
+        self.tracer = NULL_TRACER
+        # shares identical collision models between scenes and exports. None converts every one of them.
+        self.hktCache = ArtifactCache(self.cacheDir, 'hkt') if prefs().use_collision_cache else None
+        # remembers the results of tool runs, see callTool(). None always runs the tools.
+        self.toolCache = ArtifactCache(self.cacheDir, 'tools') if prefs().use_tool_cache else None
+        # converts several models with a single run of MwmBuilder. None runs it for each model.
+        batchSize = prefs().mwmbuilder_batch_size
+        self.mwmBatch = MwmBuilderBatch(self, batchSize) if batchSize > 1 else None
 
     def mirrorSettings(self):
         mirrorSceneData = self.sceneData.getMirroringBlock()
@@ -204,6 +325,19 @@ class ExportSettings:
             self._havokfilter = tool_path('havokFilterMgr', 'Havok Filter Manager')
         return self._havokfilter
 
+    @property
+    def cacheDir(self):
+        return cache_dir()
+
+    def pruneCaches(self):
+        """
+        Keeps the cache directory within the configured size by removing the entries that weren't used for the longest time.
+        """
+        maxSize = prefs().max_cache_size
+        if maxSize > 0 and (self.hktCache or self.toolCache):
+            with self.span('prune caches', 'io'):
+                prune_cache_dir(self.cacheDir, maxSize * 1024 * 1024)
+
     @property
     def hadErrors(self):
         if self._hadErrors:
@@ -211,20 +345,168 @@ class ExportSettings:
             return True
         return False
 
-    def callTool(self, cmdline, logfile=None, cwd=None, successfulExitCodes=[0], loglines=[], logtextInspector=None):
+    def callTool(self, cmdline, logfile=None, cwd=None, successfulExitCodes=[0], loglines=[], lineInspectors=[],
+                 timeout=None, inputs=None, outputs=None):
+        """
+        Runs the tool and streams its output line by line into the logfile while it is running.
+        Each line is passed to the lineInspectors which may raise a MissbehavingToolError to stop the tool right away.
+        A tool that runs longer than timeout seconds is stopped with a ToolTimeoutError.
+        Unsuccessful exit-codes raise a CalledProcessError with the last lines of output.
+
+        If the tool's inputs and outputs are given, successful runs are remembered in the tool cache.
+        A later call of the same tool with the same arguments and inputs of the same content
+        just restores the outputs and the logfile without running the tool at all.
+        """
+        cacheKey = None
+        if self.toolCache and outputs:
+            cacheKey = self.toolCacheKey(cmdline, inputs or [], outputs)
+            if self.fetchToolResult(cacheKey, outputs, logfile):
+                return
+
+        self._executeTool(cmdline, logfile, cwd, successfulExitCodes, loglines, lineInspectors, timeout)
+
+        if cacheKey:
+            self.storeToolResult(cacheKey, outputs, logfile)
+
+    def toolCacheKey(self, cmdline, inputs, outputs) -> str:
+        """
+        Identifies a tool run by the tool's executable, its arguments and the content of its input files.
+        Arguments that name input or output files are replaced by placeholders so that
+        the same run in another directory or checkout has the same key.
+        """
+        def normalize(path):
+            return os.path.normcase(os.path.abspath(path))
+
+        placeholders = {}
+        for i, f in enumerate(inputs):
+            placeholders.setdefault(normalize(f), '<input%d>' % i)
+        for i, f in enumerate(outputs):
+            placeholders.setdefault(normalize(f), '<output%d>' % i)
+
+        fp = Fingerprint()
+        fp.update(tool_digest(cmdline[0]))
+        fp.update([placeholders.get(normalize(arg), arg) for arg in cmdline[1:]])
+        for f in inputs:
+            fp.updateFile(f)
+        return fp.hexdigest()
+
+    def fetchToolResult(self, cacheKey: str, outputs, logfile) -> bool:
+        if not self.toolCache.contains(cacheKey, '.done'):
+            return False
+        for i, output in enumerate(outputs):
+            if not self.toolCache.fetch(cacheKey, output, '.out%d' % i):
+                return False
+
+        if self.isLogToolOutput and logfile:
+            if self.toolCache.fetch(cacheKey, logfile, '.log'):
+                with open(logfile, 'ab') as log:
+                    log.write(b"\n[restored from the tool cache]\n")
+            else:
+                write_to_log(logfile, b"[restored from the tool cache]\n")
+        return True
+
+    def storeToolResult(self, cacheKey: str, outputs, logfile):
+        if not all(os.path.isfile(output) for output in outputs):
+            return # the tool did not produce everything it should have, nothing worth remembering
+        for i, output in enumerate(outputs):
+            self.toolCache.put(cacheKey, output, '.out%d' % i)
+        if self.isLogToolOutput and logfile and os.path.isfile(logfile):
+            self.toolCache.put(cacheKey, logfile, '.log')
+        # marks the entry as complete, written last
+        self.toolCache.putBytes(cacheKey, b"", '.done')
+
+    def _executeTool(self, cmdline, logfile, cwd, successfulExitCodes, loglines, lineInspectors, timeout):
+        log = open(logfile, 'wb') if self.isLogToolOutput and logfile else None
         try:
-            out = subprocess.check_output(cmdline, cwd=cwd, stderr=subprocess.STDOUT)
-            if self.isLogToolOutput and logfile:
-                write_to_log(logfile, out, cmdline=cmdline, cwd=cwd, loglines=loglines)
-            if not logtextInspector is None:
-                logtextInspector(out)
-
-        except subprocess.CalledProcessError as e:
-            if self.isLogToolOutput and logfile:
-                write_to_log(logfile, e.output, cmdline=cmdline, cwd=cwd, loglines=loglines)
-            if not e.returncode in successfulExitCodes:
+            if log:
+                write_log_header(log, cmdline=cmdline, cwd=cwd, loglines=loglines)
+
+            process = self.startTool(cmdline, cwd)
+            timer = None
+            timedOut = []
+            if timeout:
+                def stop():
+                    timedOut.append(True)
+                    process.kill()
+                timer = Timer(timeout, stop)
+                timer.daemon = True
+                timer.start()
+
+            logSize = 0
+            lastLines = deque(maxlen=50)
+            try:
+                with process.stdout:
+                    for line in iter(process.stdout.readline, b''):
+                        lastLines.append(line)
+                        if log:
+                            if self.maxLogSize is None or logSize + len(line) <= self.maxLogSize:
+                                log.write(line)
+                            elif logSize <= self.maxLogSize:
+                                log.write(("\n[log truncated after %d bytes]\n" % logSize).encode('utf-8'))
+                            logSize += len(line)
+                        for inspector in lineInspectors:
+                            inspector(line)
+                returncode = process.wait()
+
+            except MissbehavingToolError as e:
+                process.kill()
+                process.wait()
+                if log:
+                    log.write(("\n[stopped: %s]\n" % e).encode('utf-8'))
                 raise
 
+            except ToolHostError as e:
+                if log:
+                    log.write(("\n[stopped: %s]\n" % e).encode('utf-8'))
+                raise MissbehavingToolError(str(e))
+
+            finally:
+                if timer:
+                    timer.cancel()
+
+            if timedOut:
+                if log:
+                    log.write(("\n[stopped: timeout after %d seconds]\n" % timeout).encode('utf-8'))
+                raise ToolTimeoutError(cmdline, timeout)
+
+            if not returncode in successfulExitCodes:
+                raise subprocess.CalledProcessError(returncode, cmdline, output=b"".join(lastLines))
+
+        finally:
+            if log:
+                log.close()
+
+    def startTool(self, cmdline, cwd=None):
+        """
+        Starts the tool as a process of its own or, if one is configured, through the tool host.
+        """
+        if self.toolHost is None:
+            return subprocess.Popen(cmdline, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        try:
+            return RemoteProcess(parse_address(self.toolHost), cmdline, cwd)
+        except (ToolHostError, ValueError) as e:
+            raise MissbehavingToolError("Tool Host: %s" % e)
+
+    def countWritten(self, changed: bool):
+        if not changed:
+            with self._unchangedLock:
+                self.unchangedFiles += 1
+
+    def runTool(self, job, *args) -> Future:
+        """
+        Submits the job to the tool runner or runs it right away if there is none.
+        Either way the result is provided as a Future.
+        """
+        if self.toolRunner is not None:
+            return self.toolRunner.submit(job, *args)
+
+        future = Future()
+        try:
+            future.set_result(job(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
     def template(self, templateString, **kwargs):
         return Template(templateString).safe_substitute(self, **kwargs)
 
@@ -250,10 +532,32 @@ class ExportSettings:
     def text(self, msg, file=None, node = None):
         self.msg('OPERATOR', msg, file, node)
 
+    def traceArgs(self, node=None, **args) -> dict:
+        """
+        Tags a trace span with the scene, cube-size and node it belongs to.
+        Only call this on Blender's main thread. Background jobs need to get the tags passed in.
+        """
+        args['scene'] = self.scene.name
+        args['CubeSize'] = self.CubeSize
+        if node is not None:
+            args['node'] = node.name
+        return args
+
+    def span(self, name, category='blender', node=None, **args):
+        return self.tracer.span(name, category, **self.traceArgs(node, **args))
+
     def cacheValue(self, key, value):
         self.cache[key] = value
         return value
 
+    def recordOutcome(self, filepath, fingerprint, outcome):
+        if self.manifest:
+            if fingerprint:
+                self.manifest.record(filepath, fingerprint, outcome)
+            else:
+                self.manifest.forget(filepath)
+        return outcome
+
     def __getitem__(self, key): # makes all attributes available for parameter substitution
         if not type(key) is str or key.startswith('_'):
             raise KeyError(key)
@@ -322,6 +626,7 @@ def export_fbx(settings: ExportSettings, filepath, objects, fbx_settings = None)
         fbxSettings.update(**fbx_settings)
 
     # these cannot be overriden and are always set here
+    objects = list(objects) # also iterated by evaluated_object_data()
     fbxSettings['use_selection'] = False # because of context_objects
     fbxSettings['context_objects'] = objects
 
@@ -333,17 +638,38 @@ def export_fbx(settings: ExportSettings, filepath, objects, fbx_settings = None)
         global_matrix = Matrix.Scale(scale, 4) * global_matrix
     fbxSettings['global_matrix'] = global_matrix
 
-    return save_single(
-        settings.operator,
-        settings.scene,
-        filepath=filepath,
-        **fbxSettings
-    )
+    # the writer evaluates the modifiers itself unless the objects already use their cached evaluated meshes
+    meshes = settings.meshes if fbxSettings['use_mesh_modifiers'] else None
+    evaluation = 'RENDER' if fbxSettings.get('use_mesh_modifiers_render', True) else 'PREVIEW'
+    # with armatures in the file the writer leaves out their deformation
+    keep = {'ARMATURE'} if 'ARMATURE' in fbxSettings['object_types'] else set()
+
+    # written next to the target and only moved there if it changed, see .staging.replace_if_changed()
+    fd, tmpfile = tempfile.mkstemp(prefix='.', suffix='.fbx', dir=os.path.dirname(filepath))
+    os.close(fd)
+    match_file_mode(tmpfile, filepath)
+    try:
+        with settings.span('export_fbx', file=basename(filepath)), \
+                evaluated_object_data(settings.scene, objects, evaluation, meshes, keep):
+            result = save_single(
+                settings.operator,
+                settings.scene,
+                filepath=tmpfile,
+                **fbxSettings
+            )
+        settings.countWritten(replace_if_changed(tmpfile, filepath))
+        return result
+    finally:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
 
 def fbx_to_hkt(settings: ExportSettings, srcfile, dstfile):
     settings.callTool(
         [settings.fbximporter, srcfile, dstfile],
-        logfile=dstfile+'.convert.log'
+        logfile=dstfile+'.convert.log',
+        timeout=settings.havokTimeout,
+        inputs=[srcfile],
+        outputs=[dstfile]
     )
 
 from .havok_options import HAVOK_OPTION_FILE_CONTENT
@@ -357,36 +683,280 @@ def hkt_filter(settings: ExportSettings, srcfile, dstfile, options=HAVOK_OPTION_
         settings.callTool(
             [settings.havokfilter, '-t', '-s', hko.name, '-p', dstfile, srcfile],
             logfile=dstfile+'.filter.log',
-            successfulExitCodes=[0,1])
+            successfulExitCodes=[0,1],
+            timeout=settings.havokTimeout,
+            inputs=[hko.name, srcfile],
+            outputs=[dstfile])
     finally:
         os.remove(hko.name)
 
-def mwmbuilder(settings: ExportSettings, fbxfile: str, havokfile: str, paramsfile: str, mwmfile: str):
+def havok_converter(settings: ExportSettings, fbxfile: str, hktfile: str, node=None) -> Future:
+    """
+    Converts the fbxfile into a .hkt file with rigid body data by running the Havok tools on the settings' tool runner.
+    The resulting Future fails with a CalledProcessError if one of the tools fails.
+    """
+    # resolve the tool paths on the calling thread, the add-on preferences are not thread-safe
+    settings.fbximporter
+    settings.havokfilter
+    traceArgs = settings.traceArgs(node, file=basename(hktfile))
+
+    return settings.runTool(_havok_job, settings, fbxfile, hktfile, traceArgs)
+
+def _havok_job(settings: ExportSettings, fbxfile: str, hktfile: str, traceArgs: dict):
+    with settings.tracer.span('fbx_to_hkt', 'tool', **traceArgs):
+        fbx_to_hkt(settings, fbxfile, hktfile)
+    with settings.tracer.span('hkt_filter', 'tool', **traceArgs):
+        hkt_filter(settings, hktfile, hktfile)
+
+class MwmModel:
+    """
+    A model on its way through MwmBuilder. Its future provides the .hkt file that actually went into the model.
+    """
+
+    def __init__(self, fbxfile: str, havokfile: str, paramsfile: str, mwmfile: str, havokJob: Future, traceArgs: dict):
+        self.basename = os.path.splitext(os.path.basename(mwmfile))[0]
+        self.fbxfile = fbxfile
+        self.havokfile = havokfile
+        self.paramsfile = paramsfile
+        self.mwmfile = mwmfile
+        self.havokJob = havokJob
+        self.traceArgs = traceArgs
+        self.future = Future()
+
+    def stage(self, tracer, contentDir: str) -> list:
+        """
+        Stages the input files into contentDir, see .staging.stage_file(). Returns the staged files.
+        If the havokfile is still being produced by havokJob this waits for it.
+        Should that job fail the model is converted without collision data.
+        """
+        if self.havokJob is not None:
+            try:
+                with tracer.span('wait for havok', 'tool', **self.traceArgs):
+                    self.havokJob.result() # the havok job was submitted earlier, so it is running or done already
+            except Exception:
+                self.havokfile = None
+
+        staged = []
+        with tracer.span('stage to Content', 'io', **self.traceArgs):
+            for srcfile, ext in ((self.fbxfile, '.fbx'), (self.paramsfile, '.xml'), (self.havokfile, '.hkt')):
+                dstfile = join(contentDir, self.basename + ext)
+                if not srcfile is None and dstfile != srcfile:
+                    stage_file(srcfile, dstfile)
+                if os.path.isfile(dstfile):
+                    staged.append(dstfile)
+        return staged
+
+    def resultfile(self, jobDir: str) -> str:
+        return join(jobDir, self.basename + '.mwm')
+
+    def collect(self, tracer, jobDir: str) -> bool:
+        """
+        Moves the result to mwmfile unless that already has the same content. Returns whether mwmfile changed.
+        """
+        resultfile = self.resultfile(jobDir)
+        if not os.path.isfile(resultfile):
+            raise MissbehavingToolError('MwmBuilder did not produce %s. Please check the log-file.' % (self.basename + '.mwm'))
+        with tracer.span('collect result', 'io', **self.traceArgs):
+            return replace_if_changed(resultfile, self.mwmfile)
+
+class MwmBuilderBatch:
+    """
+    Collects models for a single run of MwmBuilder. Starting MwmBuilder takes longer than converting
+    a typical model, so blocks with many LODs and construction phases are converted faster in batches.
+    A batch is run once it is full or when submit() is called, BlockExport.export() does so after the last node.
+    """
+
+    def __init__(self, settings: ExportSettings, maxSize: int):
+        self.settings = settings
+        self.maxSize = maxSize
+        self.models = []
+        self.jobs = [] # Futures of the submitted runs
+
+    def add(self, model: MwmModel) -> Future:
+        # MwmBuilder names its results after the input files, so a batch can't hold two models of the same name
+        if any(m.basename.lower() == model.basename.lower() for m in self.models):
+            self.submit()
+        self.models.append(model)
+        if len(self.models) >= self.maxSize:
+            self.submit()
+        return model.future
+
+    def submit(self):
+        if not self.models:
+            return
+        models, self.models = self.models, []
+        settings = self.settings
+        try:
+            toolPath = settings.mwmbuilder # resolve on the calling thread, the add-on preferences are not thread-safe
+            jobDir = _mwmbuilder_job_dir(settings, 'batch')
+            job = settings.runTool(_mwmbuilder_batch_job, settings, toolPath, jobDir, models)
+        except Exception as e:
+            job = Future()
+            job.set_exception(e)
+        job.add_done_callback(lambda job: _fail_pending_models(job, models))
+        self.jobs.append(job)
+
+def _fail_pending_models(job: Future, models: list):
+    # a batch that failed before it got to the models must not leave their outcomes waiting forever
+    if job.cancelled():
+        error = MissbehavingToolError('The run of MwmBuilder was cancelled.')
+    else:
+        error = job.exception() or MissbehavingToolError('MwmBuilder ended without providing a result.')
+    for model in models:
+        if not model.future.done():
+            model.future.set_exception(error)
+
+def _mwmbuilder_job_dir(settings: ExportSettings, name: str) -> str:
+    # each run of MwmBuilder gets a working directory of its own so that several runs can happen at the same time
+    os.makedirs(settings.mwmDir, exist_ok = True)
+    # hardlinks only work within a volume, so fall back to a working directory next to the input files
+    stagingDir = settings.mwmDir if same_volume(settings.mwmDir, settings.outputDir) else settings.outputDir
+    return tempfile.mkdtemp(prefix='.'+name+'_', dir=stagingDir)
+
+def mwmbuilder(settings: ExportSettings, fbxfile: str, havokfile: str, paramsfile: str, mwmfile: str,
+               havokJob: Future = None, node=None) -> Future:
+    """
+    Converts the given files into mwmfile. Each run of MwmBuilder gets a working directory of its own
+    so that several models can be converted at the same time on the settings' tool runner.
+    The input files are staged into that directory as hardlinks if possible, see .staging.stage_file().
+    If the havokfile is still being produced by havokJob MwmBuilder waits for it.
+    Should that job fail the model is converted without collision data.
+    With a batch size set in the add-on preferences the model is converted as part of the settings' MwmBuilderBatch.
+
+    The resulting Future provides the .hkt file that actually went into the model.
+    It fails with a CalledProcessError or a MissbehavingToolError if MwmBuilder fails.
+    """
     if not settings.isRunMwmbuilder:
         if settings.isLogToolOutput:
             write_to_log(mwmfile+'.log', b"mwmbuilder skipped.")
-        return
+        return settings.runTool(lambda: havokfile)
 
-    contentDir = join(settings.mwmDir, 'Content')
-    os.makedirs(contentDir, exist_ok = True)
-    basename = os.path.splitext(os.path.basename(mwmfile))[0]
+    model = MwmModel(fbxfile, havokfile, paramsfile, mwmfile, havokJob,
+                     settings.traceArgs(node, file=os.path.basename(mwmfile)))
+    if settings.mwmBatch is not None:
+        return settings.mwmBatch.add(model)
 
-    def copy(srcfile: str, dstfile: str):
-        if not srcfile is None and dstfile != srcfile:
-            shutil.copy2(srcfile, dstfile)
+    toolPath = settings.mwmbuilder # resolve on the calling thread, the add-on preferences are not thread-safe
+    jobDir = _mwmbuilder_job_dir(settings, model.basename)
+    return settings.runTool(_mwmbuilder_job, settings, toolPath, jobDir, model)
 
-    copy(fbxfile, join(contentDir, basename + '.fbx'))
-    copy(paramsfile, join(contentDir, basename + '.xml'))
-    copy(havokfile, join(contentDir, basename + '.hkt'))
+def _mwmbuilder_job(settings: ExportSettings, toolPath: str, jobDir: str, model: MwmModel):
+    tracer = settings.tracer
+    try:
+        contentDir = join(jobDir, 'Content')
+        os.makedirs(contentDir, exist_ok = True)
+        inputs = model.stage(tracer, contentDir)
 
-    cmdline = [settings.mwmbuilder, '/s:Content', '/m:'+basename+'.fbx', '/o:.\\']
+        cmdline = [toolPath, '/s:Content', '/m:'+model.basename+'.fbx', '/o:.\\']
 
-    def checkForLoggedErrors(logtext):
-        if b": ERROR:" in logtext:
-            raise MissbehavingToolError('MwmBuilder failed without an appropriate exit-code. Please check the log-file.')
+        def checkForLoggedErrors(line):
+            if b": ERROR:" in line:
+                raise MissbehavingToolError('MwmBuilder failed without an appropriate exit-code. Please check the log-file.')
 
-    settings.callTool(cmdline, cwd=settings.mwmDir, logfile=mwmfile+'.log', logtextInspector=checkForLoggedErrors)
-    copy(join(settings.mwmDir, basename + '.mwm'), mwmfile)
+        with tracer.span('mwmbuilder', 'tool', **model.traceArgs):
+            settings.callTool(cmdline, cwd=jobDir, logfile=model.mwmfile+'.log', lineInspectors=[checkForLoggedErrors],
+                              timeout=settings.mwmbuilderTimeout, inputs=inputs, outputs=[model.resultfile(jobDir)])
+        settings.countWritten(model.collect(tracer, jobDir))
+        return model.havokfile
+    finally:
+        shutil.rmtree(jobDir, ignore_errors=True)
+
+class BatchLog:
+    """
+    Splits the output of a batched MwmBuilder run into sections per model. A line belongs to the model
+    whose input or output file was mentioned last. Lines before the first such mention belong to every model.
+    """
+
+    def __init__(self, basenames, maxSize=None):
+        # longer names first so that 'Block_LOD1' isn't taken for 'Block'
+        names = sorted(basenames, key=len, reverse=True)
+        self.pattern = re.compile(
+            br"(?<![\w.-])(" + b"|".join(re.escape(n.encode('utf-8')) for n in names) + br")\.(?:fbx|xml|hkt|mwm)\b",
+            re.IGNORECASE)
+        self.byName = dict((n.lower().encode('utf-8'), n) for n in names)
+        self.maxSize = maxSize
+        self.common = []
+        self.sections = dict((n, []) for n in names)
+        self.sizes = dict((n, 0) for n in names)
+        self.errors = set()
+        self.current = None
+        self.lineCount = 0
+
+    def inspect(self, line: bytes):
+        self.lineCount += 1
+        match = self.pattern.search(line)
+        if match:
+            self.current = self.byName[match.group(1).lower()]
+
+        if self.current is None:
+            self.common.append(line)
+            if b": ERROR:" in line:
+                self.errors.update(self.sections.keys())
+            return
+
+        if b": ERROR:" in line:
+            self.errors.add(self.current)
+        size = self.sizes[self.current]
+        if self.maxSize is None or size + len(line) <= self.maxSize:
+            self.sections[self.current].append(line)
+        self.sizes[self.current] = size + len(line)
+
+    def inspectFile(self, logfile: str):
+        with open(logfile, 'rb') as log:
+            for line in log:
+                self.inspect(line)
+
+    def content(self, basename: str) -> bytes:
+        content = b"".join(self.common + self.sections[basename])
+        if self.maxSize is not None and self.sizes[basename] > self.maxSize:
+            content += ("\n[log truncated after %d bytes]\n" % self.maxSize).encode('utf-8')
+        return content
+
+def _mwmbuilder_batch_job(settings: ExportSettings, toolPath: str, jobDir: str, models: list):
+    tracer = settings.tracer
+    try:
+        contentDir = join(jobDir, 'Content')
+        os.makedirs(contentDir, exist_ok = True)
+        inputs = []
+        for model in models:
+            inputs += model.stage(tracer, contentDir)
+
+        # without a /m: file-mask MwmBuilder converts every model in the source directory
+        cmdline = [toolPath, '/s:Content', '/o:.\\']
+        batchLog = BatchLog([m.basename for m in models], settings.maxLogSize)
+        logfile = join(jobDir, 'mwmbuilder.log')
+        timeout = settings.mwmbuilderTimeout * len(models) if settings.mwmbuilderTimeout else None
+
+        error = None
+        try:
+            with tracer.span('mwmbuilder', 'tool', files=', '.join(m.basename for m in models)):
+                settings.callTool(cmdline, cwd=jobDir, logfile=logfile, lineInspectors=[batchLog.inspect],
+                                  timeout=timeout, inputs=inputs, outputs=[m.resultfile(jobDir) for m in models])
+        except (subprocess.SubprocessError, OSError) as e:
+            error = e
+
+        if batchLog.lineCount == 0 and os.path.isfile(logfile):
+            batchLog.inspectFile(logfile) # the result was restored from the tool cache
+
+        for model in models:
+            try:
+                if settings.isLogToolOutput:
+                    write_to_log(model.mwmfile+'.log', batchLog.content(model.basename),
+                                 cmdline=cmdline, cwd=jobDir, loglines=["Batch of %d models" % len(models)])
+                if error is not None:
+                    raise error
+                if model.basename in batchLog.errors:
+                    raise MissbehavingToolError('MwmBuilder failed without an appropriate exit-code. Please check the log-file.')
+                settings.countWritten(model.collect(tracer, jobDir))
+                model.future.set_result(model.havokfile)
+            except Exception as e:
+                model.future.set_exception(e)
+    except Exception as e:
+        for model in models:
+            if not model.future.done():
+                model.future.set_exception(e)
+    finally:
+        shutil.rmtree(jobDir, ignore_errors=True)
 
 def generateBlockDefXml(
         settings: ExportSettings,
@@ -395,7 +965,9 @@ def generateBlockDefXml(
         mountPointObjects: iter,
         mirroringObjects: iter,
         mirroringBlockSubtypeId: str,
-        constrModelFiles: iter):
+        constrModelFiles: iter,
+        file=None,
+        node=None):
 
     d = data(settings.scene)
 
@@ -442,7 +1014,12 @@ def generateBlockDefXml(
             eModel = ElementTree.SubElement(constr, 'Model')
             eModel.attrib = OrderedDict([('BuildPercentUpperBound', upperBound), ('File', constrModelpath), ])
 
-    mountpoints = mount_point_definitions(mountPointObjects)
+    mountpoints = mount_point_definitions(mountPointObjects, settings.meshes)
+    coalesced = coalesce_mount_points(mountpoints)
+    if len(coalesced) < len(mountpoints):
+        settings.text("merged %d mount-points into %d, %d fewer entries" % (
+            len(mountpoints), len(coalesced), len(mountpoints) - len(coalesced)), file=file, node=node)
+        mountpoints = coalesced
     if len(mountpoints) > 0:
         block.append(mount_points_xml(mountpoints))
 
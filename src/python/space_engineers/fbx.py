@@ -1,4 +1,5 @@
 from collections import OrderedDict
+from datetime import datetime
 from . import types
 from .utils import exportSettings, data
 import bpy
@@ -162,6 +163,17 @@ def fbx_data_object_elements(root, ob_obj, scene_data):
 
 _fbx.fbx_data_object_elements = fbx_data_object_elements
 
+# the exporter stamps each file with the current time. a fixed time keeps unchanged models byte-for-byte identical,
+# so re-exports don't touch them, see .staging.replace_if_changed()
+_FIXED_CREATION_TIME = datetime(2014, 1, 1)
+
+_original_fbx_header_elements = _fbx.fbx_header_elements
+
+def fbx_header_elements(root, scene_data, time=None):
+    return _original_fbx_header_elements(root, scene_data, time or _FIXED_CREATION_TIME)
+
+_fbx.fbx_header_elements = fbx_header_elements
+
 def shouldScaleDownEmpty(empty):
     settings = exportSettings()
     return not settings is None and settings.scaleDown and (
@@ -0,0 +1,215 @@
+from array import array
+import hashlib
+import json
+import os
+import bpy
+from .utils import data
+from .mesh_cache import evaluated_mesh
+
+MANIFEST_FILENAME = '.export-manifest.json'
+MANIFEST_VERSION = 1
+
+# outcomes that are worth remembering. failed or skipped exports are always retried.
+CACHEABLE_OUTCOMES = {'SUCCESS', 'PROBLEMS'}
+
+class Fingerprint:
+    """
+    Accumulates everything an exported file depends on into a single hash.
+    """
+
+    def __init__(self):
+        self._md5 = hashlib.md5()
+
+    def update(self, *values):
+        for value in values:
+            self._md5.update(repr(value).encode('utf-8'))
+            self._md5.update(b'\0')
+        return self
+
+    def updateBytes(self, value: bytes):
+        self._md5.update(value)
+        self._md5.update(b'\0')
+        return self
+
+    def updateFile(self, filepath: str):
+        try:
+            with open(filepath, 'rb') as f:
+                for buf in iter(lambda: f.read(65536), b''):
+                    self._md5.update(buf)
+        except FileNotFoundError:
+            self.update(None)
+        self._md5.update(b'\0')
+        return self
+
+    def updateTool(self, toolPath: str):
+        """
+        Identifies an external tool by its path, size and modification time.
+        Hashing the tool's content on every export would be needlessly slow.
+        """
+        try:
+            stat = os.stat(toolPath)
+            return self.update(toolPath, stat.st_size, stat.st_mtime)
+        except OSError:
+            return self.update(toolPath, None)
+
+    def updateProperties(self, propertyGroup):
+        if propertyGroup is None:
+            return self.update(None)
+        for name, prop in sorted(propertyGroup.rna_type.properties.items()):
+            if name == 'rna_type' or prop.is_skip_save: # skip-save properties only hold UI state
+                continue
+            value = getattr(propertyGroup, name, None)
+            if isinstance(value, set):
+                value = sorted(value)
+            elif hasattr(value, '__len__') and not isinstance(value, str):
+                value = tuple(value)
+            self.update(name, value)
+        return self
+
+    def updateObjects(self, scene, objects, evaluation='RENDER', meshes=None):
+        for ob in sorted(objects, key=lambda o: o.name):
+            fingerprintObject(self, scene, ob, evaluation, meshes)
+        return self
+
+    def hexdigest(self) -> str:
+        return self._md5.hexdigest()
+
+def _foreachBytes(collection, attribute: str, typecode: str, itemSize: int) -> bytes:
+    values = array(typecode, [0]) * (len(collection) * itemSize)
+    if len(values):
+        collection.foreach_get(attribute, values)
+    return values.tobytes()
+
+def fingerprintMesh(fp: Fingerprint, mesh: bpy.types.Mesh):
+    fp.update(len(mesh.vertices), len(mesh.polygons), len(mesh.loops))
+    fp.updateBytes(_foreachBytes(mesh.vertices, 'co', 'f', 3))
+    fp.updateBytes(_foreachBytes(mesh.loops, 'vertex_index', 'i', 1))
+    fp.updateBytes(_foreachBytes(mesh.polygons, 'loop_total', 'i', 1))
+    fp.updateBytes(_foreachBytes(mesh.polygons, 'material_index', 'i', 1))
+    fp.updateBytes(_foreachBytes(mesh.polygons, 'use_smooth', 'b', 1))
+    fp.updateBytes(_foreachBytes(mesh.edges, 'use_edge_sharp', 'b', 1))
+    # the split normals follow from the above unless the mesh has custom normals
+    fp.update(mesh.use_auto_smooth, mesh.auto_smooth_angle, mesh.has_custom_normals)
+    if mesh.has_custom_normals:
+        # calc_normals_split() must not modify a mesh that is shared through the mesh cache, so use a copy
+        copy = mesh.copy()
+        try:
+            copy.calc_normals_split()
+            fp.updateBytes(_foreachBytes(copy.loops, 'normal', 'f', 3))
+        finally:
+            bpy.data.meshes.remove(copy)
+    for uvLayer in mesh.uv_layers:
+        fp.update(uvLayer.name)
+        fp.updateBytes(_foreachBytes(uvLayer.data, 'uv', 'f', 2))
+    for colorLayer in mesh.vertex_colors:
+        fp.update(colorLayer.name)
+        fp.updateBytes(_foreachBytes(colorLayer.data, 'color', 'f', 3))
+
+def fingerprintMaterial(fp: Fingerprint, material: bpy.types.Material):
+    if material is None:
+        fp.update(None)
+        return
+    fp.update(material.name)
+    for slot in material.texture_slots:
+        image = getattr(getattr(slot, 'texture', None), 'image', None) if slot else None
+        fp.update(image.filepath if image else None)
+
+def fingerprintObject(fp: Fingerprint, scene, ob: bpy.types.Object, evaluation='RENDER', meshes=None):
+    """
+    Covers everything the FBX writer reads from an object: its transformation, the evaluated geometry
+    (modifiers applied), materials, rigid-body settings and the add-on's own object properties.
+    The evaluated geometry is taken from meshes, an .mesh_cache.EvaluatedMeshCache, if one is given.
+    """
+    fp.update(ob.name, ob.type, [tuple(row) for row in ob.matrix_world])
+    fp.update(ob.parent.name if ob.parent else None, ob.parent_type)
+
+    d = data(ob)
+    if d:
+        fp.update(d.file, d.highlight_objects, d.scaleDown)
+
+    if ob.type == 'EMPTY':
+        fp.update(ob.empty_draw_type, ob.empty_draw_size)
+
+    rbo = ob.rigid_body
+    if rbo:
+        fp.update(rbo.collision_shape, rbo.mass, rbo.friction, rbo.restitution)
+
+    for slot in ob.material_slots:
+        fingerprintMaterial(fp, slot.material if slot else None)
+
+    if ob.type in {'MESH', 'CURVE', 'SURFACE', 'FONT', 'META'}:
+        with evaluated_mesh(scene, ob, evaluation, meshes) as mesh:
+            fingerprintMesh(fp, mesh)
+
+def fingerprintCollisionObject(scene, ob: bpy.types.Object, evaluation='RENDER', meshes=None) -> str:
+    """
+    Covers only what ends up in a Havok collision model: the transformation, the evaluated geometry and the
+    rigid-body settings. Unlike fingerprintObject() the object's name is left out, so identical collision
+    objects in different scenes get the same fingerprint.
+    """
+    fp = Fingerprint()
+    fp.update([tuple(row) for row in ob.matrix_world])
+
+    rbo = ob.rigid_body
+    if rbo:
+        fp.update(rbo.collision_shape, rbo.mass, rbo.friction, rbo.restitution, rbo.use_margin, rbo.collision_margin)
+
+    with evaluated_mesh(scene, ob, evaluation, meshes) as mesh:
+        fp.update(len(mesh.vertices), len(mesh.polygons))
+        fp.updateBytes(_foreachBytes(mesh.vertices, 'co', 'f', 3))
+        fp.updateBytes(_foreachBytes(mesh.loops, 'vertex_index', 'i', 1))
+        fp.updateBytes(_foreachBytes(mesh.polygons, 'loop_total', 'i', 1))
+
+    return fp.hexdigest()
+
+class ExportManifest:
+    """
+    Remembers the fingerprint and outcome of every file exported into an output-directory.
+    A later export can use this to skip the expensive regeneration of files whose inputs did not change.
+    """
+
+    def __init__(self, outputDir: str):
+        self.path = os.path.join(outputDir, MANIFEST_FILENAME)
+        self.entries = {}
+        self.isDirty = False
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                content = json.load(f)
+            if content.get('version', None) == MANIFEST_VERSION:
+                self.entries = content.get('entries', {})
+        except (OSError, ValueError):
+            pass # no manifest yet or unreadable, everything gets exported
+
+    def lookup(self, filepath: str, fingerprint: str):
+        """
+        Provides the outcome of the previous export of filepath if the file still exists
+        and was produced from the same inputs. Otherwise the result is None.
+        """
+        entry = self.entries.get(os.path.basename(filepath), None)
+        if entry is None or entry.get('fingerprint', None) != fingerprint:
+            return None
+        if not os.path.isfile(filepath):
+            return None
+        return entry.get('outcome', None)
+
+    def record(self, filepath: str, fingerprint: str, outcome: str):
+        key = os.path.basename(filepath)
+        if outcome in CACHEABLE_OUTCOMES:
+            self.entries[key] = {'fingerprint': fingerprint, 'outcome': outcome}
+            self.isDirty = True
+        else:
+            self.forget(filepath)
+        return outcome
+
+    def forget(self, filepath: str):
+        if self.entries.pop(os.path.basename(filepath), None) is not None:
+            self.isDirty = True
+
+    def save(self):
+        if not self.isDirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, f, indent=1, sort_keys=True)
+        self.isDirty = False
@@ -1,9 +1,18 @@
+from bisect import bisect_left, insort
 from collections import OrderedDict
 from enum import Enum
 from xml.etree import ElementTree as ET
 from xml.etree.ElementTree import Comment, ProcessingInstruction, QName, _escape_attrib, _escape_cdata
+import hashlib
+import io
+import json
 import os
+import shutil
+import sys
+import tempfile
 import bpy
+from .artifact_cache import cache_dir
+from .staging import has_content, write_if_changed, match_file_mode
 
 class CommentableTreeBuilder(ET.TreeBuilder):
     def comment(self, data):
@@ -35,8 +44,10 @@ class AttributeOrderPreservingParser:
         # main callbacks
         parser.DefaultHandlerExpand = self._default
         if hasattr(target, 'start'):
+            self._target_start = target.start
             parser.StartElementHandler = self._start
         if hasattr(target, 'end'):
+            self._target_end = target.end
             parser.EndElementHandler = self._end
         if hasattr(target, 'data'):
             parser.CharacterDataHandler = target.data
@@ -72,17 +83,20 @@ class AttributeOrderPreservingParser:
             self._names[key] = name
         return name
 
+    # _start() and _end() are called for every element, so they look names up in the memo cache
+    # before falling back to _fixname() and build the attributes in one go
     def _start(self, tag, attr_list):
-        fixname = self._fixname
-        tag = fixname(tag)
-        attrib = OrderedDict() # <- this is the changed line
+        names = self._names
+        tag = names.get(tag) or self._fixname(tag)
         if attr_list:
-            for i in range(0, len(attr_list), 2):
-                attrib[fixname(attr_list[i])] = attr_list[i+1]
-        return self.target.start(tag, attrib)
+            keys = [names.get(k) or self._fixname(k) for k in attr_list[::2]]
+            attrib = OrderedDict(zip(keys, attr_list[1::2])) # <- this is the changed line
+        else:
+            attrib = OrderedDict()
+        return self._target_start(tag, attrib)
 
     def _end(self, tag):
-        return self.target.end(self._fixname(tag))
+        return self._target_end(self._names.get(tag) or self._fixname(tag))
 
     def _default(self, text):
         prefix = text[:1]
@@ -156,6 +170,19 @@ class AttributeOrderPreservingParser:
             del self.parser
             del self.target
 
+# Since Python 3.7 dicts keep their order, so the optimized XMLParser keeps the order of attributes, too.
+# Since 3.8 its TreeBuilder can keep comments. Then the pure-Python parser above is only needed as a fallback.
+_FAST_PARSER_PRESERVES_ORDER = sys.version_info >= (3, 8)
+
+def ordered_xml_parser():
+    """
+    Creates a parser that keeps comments and the order of attributes, so that a file written back with
+    the 'ordered-attribs' method differs from the original only where its elements were edited.
+    """
+    if _FAST_PARSER_PRESERVES_ORDER:
+        return ET.XMLParser(target=ET.TreeBuilder(insert_comments=True))
+    return AttributeOrderPreservingParser(target=CommentableTreeBuilder())
+
 # again, one line changed :(
 def _serialize_xml(write, elem, qnames, namespaces,
                    short_empty_elements, **kwargs):
@@ -219,11 +246,41 @@ def _serialize_xml_with_xml_decl(write, elem, qnames, namespaces,
 ET._serialize['ordered-attribs'] = _serialize_xml_with_xml_decl
 
 class XmlEditor:
+    """
+    Edits the subelements of elements while keeping their formatting and the order of known elements.
+    For each element it edits the editor keeps an index of the positions of its subelements by tagname.
+    So the subelements must only be inserted or removed through the editor while it is in use.
+    """
+
     def __init__(self, knownSubelements: list, indentLevel=0, indent="    ", base: ET.Element = None):
         self.knownElements = knownSubelements
         self.knownElemPos = {name : pos for pos, name in enumerate(knownSubelements)}
         self.indentLevel = indentLevel
         self.indent = indent
+        self.indexes = {} # element -> [number of subelements when indexed, {tagname: [sorted positions]}]
+
+    def index(self, base: ET.Element) -> dict:
+        entry = self.indexes.get(base, None)
+        if entry is None or entry[0] != len(base): # new or changed behind the editor's back
+            positions = {}
+            for i, e in enumerate(base):
+                positions.setdefault(e.tag, []).append(i)
+            entry = self.indexes[base] = [len(base), positions]
+        return entry[1]
+
+    def _moved(self, base: ET.Element, index: int, delta: int):
+        entry = self.indexes.get(base, None)
+        if entry is None:
+            return
+        if entry[0] + delta != len(base):
+            del self.indexes[base]
+            return
+
+        for positions in entry[1].values():
+            # the positions are sorted, only those behind index move
+            for i in range(bisect_left(positions, index), len(positions)):
+                positions[i] += delta
+        entry[0] = len(base)
 
     def newElement(self, base: ET.Element, index: int, tagName: str) -> ET.Element:
         """
@@ -245,19 +302,29 @@ class XmlEditor:
             result.tail = "\n" + (indent * level)
 
         base.insert(index, result)
+        self._moved(base, index, 1)
+        if base in self.indexes:
+            insort(self.indexes[base][1].setdefault(tagName, []), index)
         return result
 
+    def remove(self, base: ET.Element, element: ET.Element):
+        index = next(i for i in self.index(base).get(element.tag, []) if base[i] is element)
+        base.remove(element)
+        positions = self.indexes[base][1][element.tag]
+        positions.remove(index)
+        if not positions:
+            del self.indexes[base][1][element.tag]
+        self._moved(base, index + 1, -1)
+
     def find(self, base: ET.Element, tagName: str) -> tuple:
         """
         Finds a singluar subelement with the given tagName
         :returns: (index, subelement) or None
         """
-        # runtime O(n). But it's simple, doesn't require additional data-structures and
-        # is probably fast enough for small numbers of subelements.
-        for i, e in enumerate(base):
-            if e.tag == tagName:
-                return (i, e)
-        return None
+        positions = self.index(base).get(tagName, None)
+        if not positions:
+            return None
+        return (positions[0], base[positions[0]])
 
     def subelement(self, base: ET.Element, tagName: str) -> ET.Element:
         """
@@ -321,7 +388,7 @@ class MergeResult(Enum):
 class CubeBlocksMerger:
     def __init__(self, cubeBlocksPath: str, indent="    ", backup=True, allowRenames=False):
         self.path = bpy.path.abspath(cubeBlocksPath)
-        self.tree = ET.parse(cubeBlocksPath, parser=AttributeOrderPreservingParser(target=CommentableTreeBuilder()))
+        self.tree = ET.parse(cubeBlocksPath, parser=ordered_xml_parser())
         self.backup = backup
         self.allowRenames = allowRenames
 
@@ -335,6 +402,7 @@ class CubeBlocksMerger:
 
         self.blocksById = {}
         self.blocksByPairAndSize = {}
+        self._createEditors()
 
         for block in blockContainer.iter("Definition"):
             subtypeId = block.findtext("./Id/SubtypeId", None)
@@ -346,27 +414,39 @@ class CubeBlocksMerger:
             if pairName != None and size != None:
                 self.blocksByPairAndSize[(pairName, size)] = block
 
+    def _createEditors(self):
+        # shared by all merges, so a block's subelements are only indexed once
+        self.blockEditor = XmlEditor(BLOCK_ELEMENTS, indentLevel=2, indent="\t")
+        self.listEditor = XmlEditor([], indentLevel=3, indent="\t")
+        self.idEditor = XmlEditor(ID_ELEMENTS, indentLevel=3, indent="\t")
+
+    def findBlock(self, subtypeId: str) -> ET.Element:
+        return self.blocksById.get(subtypeId, None)
+
+    def findBlockByPairAndSize(self, pairName: str, size: str) -> ET.Element:
+        return self.blocksByPairAndSize.get((pairName, size), None)
+
     def merge(self, xml: ET.Element, renameAllowed=False) -> set:
         id = xml.findtext("./Id/SubtypeId", None)
         if (id == None):
             raise ValueError("xml has no <SubtypeId>")
 
-        block = self.blocksById.get(id, None)
+        block = self.findBlock(id)
         rename = set()
 
         if block == None and renameAllowed:
             pairName = xml.findtext("BlockPairName", None)
             size = xml.findtext("CubeSize", None)
             if pairName != None and size != None:
-                block = self.blocksByPairAndSize.get((pairName, size), None)
+                block = self.findBlockByPairAndSize(pairName, size)
                 rename = {MergeResult.RENAMED}
 
         if block == None:
             return {MergeResult.NOT_FOUND}
 
-        blockEditor = XmlEditor(BLOCK_ELEMENTS, indentLevel=2, indent="\t")
-        listEditor = XmlEditor([], indentLevel=3, indent="\t")
-        idEditor = XmlEditor(ID_ELEMENTS, indentLevel=3, indent="\t")
+        blockEditor = self.blockEditor
+        listEditor = self.listEditor
+        idEditor = self.idEditor
 
         for e in xml:
             if e.tag == 'Id':
@@ -382,6 +462,7 @@ class CubeBlocksMerger:
 
                 list.text = ""
                 list[:] = []
+                listEditor.indexes.pop(list, None)
                 for item in e:
                     itemCopy = listEditor.newElement(list, len(list), item.tag)
                     itemCopy.text = item.text
@@ -397,16 +478,458 @@ class CubeBlocksMerger:
 
         for listTag in LIST_ELEMENTS:
             if xml.find(listTag) == None:
-                list = block.find(listTag)
-                if list != None:
-                    block.remove(list)
+                existing = blockEditor.find(block, listTag)
+                if existing != None:
+                    blockEditor.remove(block, existing[1])
 
         return {MergeResult.MERGED} | rename
 
-    def write(self):
+    def write(self) -> bool:
+        """
+        Writes the merged definitions unless the file already has that content. In that case the file
+        and its backup are left alone. Returns whether the file was written.
+        """
+        content = io.BytesIO()
+        self.tree.write(content, encoding="utf-8", xml_declaration=False, method="ordered-attribs")
+        content = content.getvalue()
+        if has_content(self.path, len(content), lambda: hashlib.md5(content).digest()):
+            return False
+
         if self.backup:
             if os.path.exists(self.path + ".bak"):
                 os.remove(self.path + ".bak")
             os.rename(self.path, self.path + ".bak")
 
-        self.tree.write(self.path, encoding="utf-8", xml_declaration=False, method="ordered-attribs")
+        return write_if_changed(self.path, content)
+
+class DefinitionSpans:
+    """
+    Where the <Definition> elements of <CubeBlocks> are in an .sbc file, see scan_definition_spans().
+    """
+
+    def __init__(self):
+        self.spans = [] # [start, end) byte-offsets of each <Definition>, end is None for <Definition/>
+        self.subtypeIds = {} # SubtypeId -> position in spans
+        self.pairs = {} # (BlockPairName, CubeSize) -> position in spans
+        self.namespaces = OrderedDict() # prefix -> uri of the declarations outside of <CubeBlocks>
+        self.encoding = 'utf-8'
+        self.hasCubeBlocks = False
+
+_DEFINITION_PATH = ['Definitions', 'CubeBlocks', 'Definition']
+
+def scan_definition_spans(sbcPath: str) -> DefinitionSpans:
+    """
+    Streams through an .sbc file and records the byte-offsets of its block-definitions
+    together with their SubtypeId, BlockPairName and CubeSize. No elements are built.
+    """
+    from xml.parsers import expat
+
+    result = DefinitionSpans()
+    parser = expat.ParserCreate(None, "}")
+    path = [] # tagnames from <Definitions> down to the current element
+    texts = {}
+    endTags = [] # (position, byte-offset of the '</' of the end-tag)
+
+    def xmlDecl(version, encoding, standalone):
+        if encoding:
+            result.encoding = encoding.lower()
+
+    def namespaceDecl(prefix, uri):
+        if len(path) < 2:
+            result.namespaces[prefix or ''] = uri
+
+    def start(tag, attrib):
+        path.append(tag)
+        if path == _DEFINITION_PATH:
+            result.spans.append([parser.CurrentByteIndex, None])
+            texts.clear()
+        elif path == _DEFINITION_PATH[:2]:
+            result.hasCubeBlocks = True
+
+    def data(text):
+        if len(path) > 3 and path[:3] == _DEFINITION_PATH:
+            key = '/'.join(path[3:])
+            texts[key] = texts.get(key, '') + text
+
+    def end(tag):
+        if path == _DEFINITION_PATH:
+            position = len(result.spans) - 1
+            if parser.CurrentByteIndex != result.spans[position][0]: # not an empty-element tag
+                endTags.append((position, parser.CurrentByteIndex))
+                subtypeId = texts.get('Id/SubtypeId', None)
+                if subtypeId != None:
+                    result.subtypeIds[subtypeId] = position
+                pairName = texts.get('BlockPairName', None)
+                size = texts.get('CubeSize', None)
+                if pairName != None and size != None:
+                    result.pairs[(pairName, size)] = position
+        path.pop()
+
+    parser.XmlDeclHandler = xmlDecl
+    parser.StartNamespaceDeclHandler = namespaceDecl
+    parser.StartElementHandler = start
+    parser.CharacterDataHandler = data
+    parser.EndElementHandler = end
+    parser.buffer_text = 1
+
+    with open(sbcPath, 'rb') as f:
+        try:
+            parser.ParseFile(f)
+        except expat.ExpatError as e:
+            err = ET.ParseError(str(e))
+            err.code = e.code
+            err.position = e.lineno, e.offset
+            raise err
+
+        if result.encoding.startswith('utf-16') or result.encoding.startswith('utf-32'):
+            raise ValueError("%s is encoded in %s, which cannot be patched" % (sbcPath, result.encoding))
+
+        # end-tags have no attributes, so the first '>' after '</' ends them
+        for position, endTagStart in endTags:
+            f.seek(endTagStart)
+            endTag = f.read(256)
+            result.spans[position][1] = endTagStart + endTag.index(b'>') + 1
+
+    return result
+
+class CubeBlocksPatcher(CubeBlocksMerger):
+    """
+    Merges block-definitions into an .sbc file like CubeBlocksMerger but only parses and rewrites the
+    <Definition> elements that are merged into. The rest of the file is copied through byte for byte,
+    so time and memory depend on the merged definitions and not on the size of the file.
+    Definitions that can't be written back on their own, because they use namespaces that are declared
+    inside of them, make write() fall back to merging everything with a CubeBlocksMerger.
+    """
+
+    def __init__(self, cubeBlocksPath: str, indent="    ", backup=True, allowRenames=False):
+        self.path = bpy.path.abspath(cubeBlocksPath)
+        self.backup = backup
+        self.allowRenames = allowRenames
+        self.definitions = scan_definition_spans(self.path)
+        if not self.definitions.hasCubeBlocks:
+            raise ValueError(cubeBlocksPath + " contains no <Definitions> with <CubeBlocks>")
+        self.blocks = OrderedDict() # position -> parsed <Definition>
+        self.merges = [] # (xml, renameAllowed), replayed if write() has to fall back to CubeBlocksMerger
+        self._createEditors()
+
+    def merge(self, xml: ET.Element, renameAllowed=False) -> set:
+        result = super().merge(xml, renameAllowed=renameAllowed)
+        if MergeResult.NOT_FOUND not in result:
+            self.merges.append((xml, renameAllowed))
+        return result
+
+    def findBlock(self, subtypeId: str) -> ET.Element:
+        return self.block(self.definitions.subtypeIds.get(subtypeId, None))
+
+    def findBlockByPairAndSize(self, pairName: str, size: str) -> ET.Element:
+        return self.block(self.definitions.pairs.get((pairName, size), None))
+
+    def block(self, position: int) -> ET.Element:
+        if position is None:
+            return None
+        block = self.blocks.get(position, None)
+        if block is None:
+            # the span is parsed inside an element with the namespace-declarations it had in the file
+            declarations = ''.join(' xmlns%s="%s"' % (':' + prefix if prefix else '', _escape_attrib(uri))
+                                   for prefix, uri in self.definitions.namespaces.items())
+            parser = ordered_xml_parser()
+            parser.feed('<Definitions%s>' % declarations)
+            parser.feed(self.original(position).decode(self.definitions.encoding))
+            parser.feed('</Definitions>')
+            block = self.blocks[position] = parser.close()[0]
+        return block
+
+    def original(self, position: int) -> bytes:
+        start, end = self.definitions.spans[position]
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def patched(self, position: int) -> bytes:
+        block = self.blocks[position]
+        prefixes = {uri: prefix for prefix, uri in self.definitions.namespaces.items()}
+        content = []
+        _serialize_xml(content.append, block, _qnames(block, prefixes), None, short_empty_elements=True)
+        content = ''.join(content).encode(self.definitions.encoding, 'xmlcharrefreplace')
+        if b'\r\n' in self.original(position): # expat turned them into '\n'
+            content = content.replace(b'\n', b'\r\n')
+        return content
+
+    def write(self) -> bool:
+        """
+        Writes the file with the merged definitions spliced in unless none of them changed.
+        In that case the file and its backup are left alone. Returns whether the file was written.
+        """
+        patches = []
+        try:
+            for position in sorted(self.blocks.keys()):
+                content = self.patched(position)
+                if content != self.original(position):
+                    patches.append((self.definitions.spans[position], content))
+        except ValueError:
+            return self.writeWholeFile()
+        if not patches:
+            return False
+
+        fd, tmpfile = tempfile.mkstemp(prefix='.', suffix='.sbc', dir=os.path.dirname(self.path))
+        try:
+            with open(self.path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                offset = 0
+                for (start, end), content in patches:
+                    _copy_bytes(src, dst, start - offset)
+                    dst.write(content)
+                    src.seek(end)
+                    offset = end
+                shutil.copyfileobj(src, dst)
+            match_file_mode(tmpfile, self.path)
+
+            if self.backup:
+                if os.path.exists(self.path + ".bak"):
+                    os.remove(self.path + ".bak")
+                os.rename(self.path, self.path + ".bak")
+            os.replace(tmpfile, self.path)
+        except:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            raise
+        return True
+
+    def writeWholeFile(self) -> bool:
+        merger = CubeBlocksMerger(self.path, backup=self.backup, allowRenames=self.allowRenames)
+        for xml, renameAllowed in self.merges:
+            merger.merge(xml, renameAllowed=renameAllowed)
+        return merger.write()
+
+def _copy_bytes(src, dst, length: int):
+    while length > 0:
+        buf = src.read(min(length, 65536))
+        if not buf:
+            break
+        dst.write(buf)
+        length -= len(buf)
+
+def _qnames(elem: ET.Element, prefixes: dict) -> dict:
+    # like ElementTree._namespaces() but with the prefixes the file declared instead of the well-known ones
+    qnames = {None: None}
+
+    def add(qname):
+        if qname in qnames:
+            return
+        if qname[:1] != "{":
+            qnames[qname] = qname
+            return
+        uri, local = qname[1:].split("}", 1)
+        prefix = prefixes.get(uri, None)
+        if prefix is None:
+            raise ValueError("namespace %s is not declared outside of <CubeBlocks>" % uri)
+        qnames[qname] = "%s:%s" % (prefix, local) if prefix else local
+
+    for e in elem.iter():
+        if isinstance(e.tag, str):
+            add(e.tag)
+        elif isinstance(e.tag, QName):
+            add(e.tag.text)
+        for key, value in e.items():
+            add(key.text if isinstance(key, QName) else key)
+            if isinstance(value, QName):
+                add(value.text)
+    return qnames
+
+DEFINITIONS_INDEX_VERSION = 1
+
+def scan_definitions(sbcPath: str) -> dict:
+    """
+    Lists the block-definitions of an .sbc file by SubtypeId and by BlockPairName and CubeSize,
+    together with their position among the <Definition> elements of <CubeBlocks>.
+    Uses ElementTree's fast parser because neither comments nor the order of attributes matter here.
+    """
+    subtypeIds = {}
+    pairs = []
+    depth = 0
+    position = 0
+    inCubeBlocks = False
+    for event, elem in ET.iterparse(sbcPath, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2 and elem.tag == 'CubeBlocks':
+                inCubeBlocks = True
+            continue
+
+        depth -= 1
+        if depth == 1 and elem.tag == 'CubeBlocks':
+            inCubeBlocks = False
+        elif depth == 2 and inCubeBlocks and elem.tag == 'Definition':
+            subtypeId = elem.findtext("./Id/SubtypeId", None)
+            if subtypeId != None:
+                subtypeIds[subtypeId] = position
+            pairName = elem.findtext("BlockPairName", None)
+            size = elem.findtext("CubeSize", None)
+            if pairName != None and size != None:
+                pairs.append([pairName, size, position])
+            position += 1
+            elem.clear()
+
+    return {'subtypeIds': subtypeIds, 'pairs': pairs}
+
+def find_data_dir(path: str) -> str:
+    """
+    The mod's Data directory that contains path or, if there is none, the directory of path.
+    """
+    directory = path if os.path.isdir(path) else os.path.dirname(path)
+    candidate = directory
+    while True:
+        if os.path.basename(candidate).lower() == 'data':
+            return candidate
+        parent = os.path.dirname(candidate)
+        if parent == candidate:
+            return directory
+        candidate = parent
+
+class DefinitionsIndex:
+    """
+    Remembers which .sbc file of a mod's Data directory contains which block-definition.
+    The index is kept in the cache directory, not in the mod, under a name derived from the path of the Data directory.
+    Files are only scanned again if their size or modification time changed.
+    """
+
+    def __init__(self, dataDir: str, cacheDir: str = None):
+        self.dataDir = dataDir
+        key = hashlib.md5(os.path.normcase(os.path.abspath(dataDir)).encode('utf-8')).hexdigest()
+        self.path = os.path.join(cacheDir or cache_dir(), 'definitions', key + '.json')
+        self.files = {}
+        self.isDirty = False
+        self._lookup = None # (SubtypeId -> relpath, (BlockPairName, CubeSize) -> relpath), see lookup()
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                content = json.load(f)
+            if content.get('version', None) == DEFINITIONS_INDEX_VERSION:
+                self.files = content.get('files', {})
+        except (OSError, ValueError):
+            pass
+
+    def refresh(self) -> list:
+        """
+        Brings the index up to date with the .sbc files on disk. Returns the files that could not be parsed.
+        """
+        found = set()
+        broken = []
+        for dirpath, dirnames, filenames in os.walk(self.dataDir):
+            for filename in filenames:
+                if filename.lower().endswith('.sbc'):
+                    relpath = os.path.relpath(os.path.join(dirpath, filename), self.dataDir)
+                    found.add(relpath)
+                    if not self.update(relpath):
+                        broken.append(relpath)
+
+        for relpath in set(self.files.keys()) - found:
+            del self.files[relpath]
+            self.changed()
+        return broken
+
+    def changed(self):
+        self.isDirty = True
+        self._lookup = None
+
+    def update(self, relpath: str, force=False) -> bool:
+        try:
+            stat = os.stat(os.path.join(self.dataDir, relpath))
+        except OSError:
+            return False
+
+        entry = self.files.get(relpath, None)
+        if not force and entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return True
+
+        try:
+            definitions = scan_definitions(os.path.join(self.dataDir, relpath))
+        except (OSError, ET.ParseError):
+            self.files.pop(relpath, None)
+            self.changed()
+            return False
+
+        definitions['size'] = stat.st_size
+        definitions['mtime'] = stat.st_mtime
+        self.files[relpath] = definitions
+        self.changed()
+        return True
+
+    def lookup(self) -> tuple:
+        if self._lookup is None:
+            bySubtypeId = {}
+            byPairAndSize = {}
+            # the first file in the order of their paths wins if several contain the same definition
+            for relpath in sorted(self.files.keys()):
+                for subtypeId in self.files[relpath]['subtypeIds']:
+                    bySubtypeId.setdefault(subtypeId, relpath)
+                for pairName, size, position in self.files[relpath]['pairs']:
+                    byPairAndSize.setdefault((pairName, size), relpath)
+            self._lookup = (bySubtypeId, byPairAndSize)
+        return self._lookup
+
+    def fileBySubtypeId(self, subtypeId: str) -> str:
+        return self.lookup()[0].get(subtypeId, None)
+
+    def fileByPairAndSize(self, pairName: str, size: str) -> str:
+        return self.lookup()[1].get((pairName, size), None)
+
+    def save(self):
+        if not self.isDirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'version': DEFINITIONS_INDEX_VERSION, 'files': self.files}, f, indent=1, sort_keys=True)
+        self.isDirty = False
+
+class ModDefinitionsMerger:
+    """
+    Merges block-definitions into whichever .sbc file of a mod's Data directory already contains them.
+    Only the files that receive a definition are patched, see DefinitionsIndex and CubeBlocksPatcher.
+    """
+
+    def __init__(self, dataDir: str, indent="    ", backup=True):
+        self.index = DefinitionsIndex(bpy.path.abspath(dataDir))
+        self.indent = indent
+        self.backup = backup
+        self.mergers = OrderedDict() # relpath -> CubeBlocksPatcher
+        self.brokenFiles = self.index.refresh()
+
+    @property
+    def dataDir(self):
+        return self.index.dataDir
+
+    def merger(self, relpath: str) -> CubeBlocksPatcher:
+        merger = self.mergers.get(relpath, None)
+        if merger is None:
+            merger = self.mergers[relpath] = CubeBlocksPatcher(
+                os.path.join(self.dataDir, relpath), indent=self.indent, backup=self.backup)
+        return merger
+
+    def merge(self, xml: ET.Element, renameAllowed=False) -> set:
+        id = xml.findtext("./Id/SubtypeId", None)
+        if (id == None):
+            raise ValueError("xml has no <SubtypeId>")
+
+        relpath = self.index.fileBySubtypeId(id)
+        if relpath is None and renameAllowed:
+            relpath = self.index.fileByPairAndSize(xml.findtext("BlockPairName", None), xml.findtext("CubeSize", None))
+        if relpath is None:
+            return {MergeResult.NOT_FOUND}
+
+        return self.merger(relpath).merge(xml, renameAllowed=renameAllowed)
+
+    def changedFiles(self) -> list:
+        return [merger.path for merger in self.mergers.values()]
+
+    def write(self) -> list:
+        """
+        Writes the files that actually changed. Returns their paths.
+        """
+        written = []
+        for relpath, merger in self.mergers.items():
+            if merger.write():
+                self.index.update(relpath, force=True)
+                written.append(merger.path)
+        self.mergers.clear()
+        self.index.save()
+        return written
@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from contextlib import contextmanager, ExitStack
+import bpy
+
+def estimated_mesh_size(mesh: bpy.types.Mesh) -> int:
+    """
+    A rough estimate of the memory a mesh takes up, in bytes.
+    """
+    return 48 * len(mesh.vertices) + 24 * len(mesh.edges) + 24 * len(mesh.loops) + 32 * len(mesh.polygons)
+
+class EvaluatedMeshCache:
+    """
+    Keeps the meshes of objects with their modifiers applied for the duration of an export, so that the FBX writer,
+    fingerprinting and the extraction of mount-points don't evaluate the same modifier stacks again and again.
+    Once the meshes take up more than budget bytes the least recently used ones are removed.
+    clear() removes all of them, BlockExport.export() does so when it is done.
+    """
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.meshes = OrderedDict() # (object-name, evaluation) -> [mesh, size, borrowers]
+        self.size = 0
+
+    @contextmanager
+    def mesh(self, scene, ob: bpy.types.Object, evaluation='RENDER'):
+        """
+        Provides the evaluated mesh of ob. The mesh is shared and must not be modified.
+        It is only guaranteed to exist until the with-block ends.
+        """
+        key = (ob.name, evaluation)
+        entry = self.meshes.get(key, None)
+        if entry is None:
+            mesh = ob.to_mesh(scene, True, evaluation)
+            entry = self.meshes[key] = [mesh, estimated_mesh_size(mesh), 0]
+            self.size += entry[1]
+        else:
+            self.meshes.move_to_end(key)
+
+        entry[2] += 1
+        try:
+            yield entry[0]
+        finally:
+            entry[2] -= 1
+            self.evict()
+
+    def evict(self):
+        for key in list(self.meshes.keys()):
+            if self.size <= self.budget:
+                break
+            mesh, size, borrowers = self.meshes[key]
+            if borrowers == 0: # still in use further up the call-stack
+                del self.meshes[key]
+                self.size -= size
+                bpy.data.meshes.remove(mesh)
+
+    def clear(self):
+        for mesh, size, borrowers in self.meshes.values():
+            bpy.data.meshes.remove(mesh)
+        self.meshes.clear()
+        self.size = 0
+
+@contextmanager
+def evaluated_mesh(scene, ob: bpy.types.Object, evaluation='RENDER', meshes: EvaluatedMeshCache = None):
+    """
+    Provides the evaluated mesh of ob from the given cache or, without one, as a temporary mesh.
+    """
+    if meshes is not None:
+        with meshes.mesh(scene, ob, evaluation) as mesh:
+            yield mesh
+        return
+
+    mesh = ob.to_mesh(scene, True, evaluation)
+    try:
+        yield mesh
+    finally:
+        bpy.data.meshes.remove(mesh)
+
+@contextmanager
+def evaluated_object_data(scene, objects, evaluation='RENDER', meshes: EvaluatedMeshCache = None, keep=()):
+    """
+    Lets mesh objects use their evaluated meshes from the cache as their data and turns off their modifiers
+    until the with-block ends. Exporters that evaluate the objects themselves, like the FBX writer, then just
+    use the cached meshes. Objects with modifiers of a type in keep are left alone.
+    """
+    with ExitStack() as stack:
+        if meshes is not None:
+            for ob in objects:
+                if ob.type != 'MESH' or ob.library or not any(m.show_render or m.show_viewport for m in ob.modifiers):
+                    continue
+                if any(m.type in keep for m in ob.modifiers):
+                    continue
+                mesh = stack.enter_context(meshes.mesh(scene, ob, evaluation))
+                # registered after borrowing the mesh, so it is restored before the mesh can be evicted
+                stack.callback(_restore_object_data, ob, ob.data,
+                               [(m, m.show_render, m.show_viewport) for m in ob.modifiers])
+                ob.data = mesh
+                for m in ob.modifiers:
+                    m.show_render = False
+                    m.show_viewport = False
+        yield
+
+def _restore_object_data(ob: bpy.types.Object, data, modifiers: list):
+    ob.data = data
+    for m, show_render, show_viewport in modifiers:
+        m.show_render = show_render
+        m.show_viewport = show_viewport
@@ -1,14 +1,21 @@
 from collections import namedtuple, OrderedDict
 from xml.etree import ElementTree
-from bgl import glEnable, glDisable, glColor3f, glVertex3f, glLineWidth, glBegin, glEnd, glLineStipple, GL_LINE_STRIP, GL_LINES, GL_LINE_STIPPLE
+from bgl import glEnable, glDisable, glColor3f, glVertex3f, glLineWidth, glBegin, glEnd, glLineStipple, GL_LINE_STRIP, GL_LINES, GL_LINE_STIPPLE, \
+    glColor4f, glGenLists, glNewList, glEndList, glCallList, glDeleteLists, GL_COMPILE, GL_QUADS, GL_LINE_LOOP, GL_BLEND
 from mathutils import Matrix, Vector
 from math import sqrt
 from .utils import BoxCorner, bounds, sparse, X, Y, Z, transX, transY, transZ, rot, mirror, flip, layers, layer_bits, \
-    scene
-from .types import show_block_bounds, block_bounds, is_small_block, data
+    scene, layers_overlap
+from .types import show_block_bounds, show_mount_points, block_bounds, is_small_block, data
+from .mesh_cache import evaluated_mesh
 
 import bpy
 
+try:
+    import numpy
+except ImportError: # bundled with Blender since 2.70, builds without it use the slower code
+    numpy = None
+
 MOUNT_POINT_MATERIAL = 'MountPoint'
 MOUNT_POINT_COLOR = (0.317, 1, 0.032)
 
@@ -35,13 +42,18 @@ Sides = [
 # the dot-product of two vectors with an angle of 45 degrees between them
 ANGLE_45 = sqrt(2.0) / 2.0
 
-def mount_point_definitions(mount_point_objects):
+# which corners of a BoundingBox are made of the maximum rather than the minimum coordinates
+_CORNER_IS_MAX = [tuple(c > 0.5 for c in corner) for corner in bounds([(0, 0, 0), (1, 1, 1)])]
+
+def mount_point_definitions(mount_point_objects, meshes=None):
     """
     This algorithm does the following
     1. find all polygons with material 'MountPoint' from all given objects
     2. decide which SE block-side each polygon is facing by comparing polygon normals
     3. project the bounding box of the polygon onto that SE block-side
     4. convert that projection into the coordinate system of the corresponding SE block-side
+
+    With NumPy available all polygons of an object are processed at once, see _polygon_mount_points_numpy().
     """
 
     # normalizes sizes to one block-cube
@@ -52,6 +64,8 @@ def mount_point_definitions(mount_point_objects):
 
     def first(iterable): return next(iterable, None)
 
+    polygon_mount_points = _polygon_mount_points_numpy if numpy else _polygon_mount_points
+
     for ob in mount_point_objects:
         if 'MESH' != ob.type: continue
 
@@ -60,35 +74,164 @@ def mount_point_definitions(mount_point_objects):
 
         if None == mp_mat_slot: continue # 0 evaluates to False
 
-        rotate_to_world = ob.matrix_world.to_3x3().normalized()
+        # mesh with modifiers applied - including mirroring & array
+        with evaluated_mesh(scene(), ob, 'PREVIEW', meshes) as mesh:
+            mount_points += polygon_mount_points(ob, mesh, mp_mat_slot, normalize, bound_box)
 
-        # create temporary mesh with modifiers applied - including mirroring & array
-        mesh = ob.to_mesh(scene(), True, 'PREVIEW')
+    return mount_points
+
+def _polygon_mount_points(ob, mesh, mp_mat_slot, normalize, bound_box):
+    mount_points = []
+
+    def first(iterable): return next(iterable, None)
 
-        try:
-            for poly in mesh.polygons:
-                if not poly.material_index == mp_mat_slot: continue
+    rotate_to_world = ob.matrix_world.to_3x3().normalized()
 
-                polyside = first(side for side in Sides
-                    if (rotate_to_world * poly.normal * side.normal) > ANGLE_45)
+    for poly in mesh.polygons:
+        if not poly.material_index == mp_mat_slot: continue
 
-                if not polyside: continue
+        polyside = first(side for side in Sides
+            if (rotate_to_world * poly.normal * side.normal) > ANGLE_45)
 
-                polybounds = bounds([ob.matrix_world * mesh.vertices[v].co for v in poly.vertices])
+        if not polyside: continue
 
-                start = polybounds[polyside.start_vertex] - bound_box[polyside.start_vertex]
-                end = polybounds[polyside.end_vertex] - bound_box[polyside.start_vertex]
+        polybounds = bounds([ob.matrix_world * mesh.vertices[v].co for v in poly.vertices])
 
-                start = normalize * polyside.projection * start
-                end = normalize * polyside.projection * end
+        start = polybounds[polyside.start_vertex] - bound_box[polyside.start_vertex]
+        end = polybounds[polyside.end_vertex] - bound_box[polyside.start_vertex]
 
-                mount_points.append((polyside.name, start.x, start.y, end.x, end.y))
+        start = normalize * polyside.projection * start
+        end = normalize * polyside.projection * end
 
-        finally:
-            bpy.data.meshes.remove(mesh)
+        mount_points.append((polyside.name, start.x, start.y, end.x, end.y))
 
     return mount_points
 
+def _matrix3(matrix) -> 'numpy.ndarray':
+    return numpy.array([[matrix[row][col] for col in range(3)] for row in range(3)], numpy.float32)
+
+def _foreach_get(collection, attribute, dtype, width=1) -> 'numpy.ndarray':
+    values = numpy.empty(len(collection) * width, dtype)
+    collection.foreach_get(attribute, values)
+    return values.reshape(-1, width) if width > 1 else values
+
+def _polygon_mount_points_numpy(ob, mesh, mp_mat_slot, normalize, bound_box):
+    """
+    Same as _polygon_mount_points() but reads the mesh in bulk and handles all polygons at once.
+    Everything is calculated in single precision, like mathutils does, so the results are the same.
+    """
+    material_index = _foreach_get(mesh.polygons, 'material_index', numpy.int32)
+    selected = numpy.flatnonzero(material_index == mp_mat_slot)
+    if len(selected) == 0:
+        return []
+
+    normals = _foreach_get(mesh.polygons, 'normal', numpy.float32, 3)[selected]
+    loop_start = _foreach_get(mesh.polygons, 'loop_start', numpy.int32)[selected]
+    loop_total = _foreach_get(mesh.polygons, 'loop_total', numpy.int32)[selected]
+    vertex_index = _foreach_get(mesh.loops, 'vertex_index', numpy.int32)
+    co = _foreach_get(mesh.vertices, 'co', numpy.float32, 3)
+
+    # the first side each polygon is facing, like _polygon_mount_points() does
+    rotate_to_world = _matrix3(ob.matrix_world.to_3x3().normalized())
+    side_normals = numpy.array([tuple(side.normal) for side in Sides], numpy.float32)
+    facing = numpy.dot(numpy.dot(normals, rotate_to_world.T), side_normals.T) > ANGLE_45
+    has_side = facing.any(axis=1)
+    side_index = facing.argmax(axis=1)
+
+    # bounding-box of each polygon in world-space: the polygons' loops one after the other, reduced per polygon
+    offsets = numpy.cumsum(loop_total) - loop_total
+    loops = numpy.repeat(loop_start - offsets, loop_total) + numpy.arange(offsets[-1] + loop_total[-1])
+    matrix_world = numpy.array([tuple(row) for row in ob.matrix_world], numpy.float32)
+    world = numpy.dot(co[vertex_index[loops]], matrix_world[:3, :3].T) + matrix_world[:3, 3]
+    mins = numpy.minimum.reduceat(world, offsets)
+    maxs = numpy.maximum.reduceat(world, offsets)
+
+    def corner(index, rows):
+        return numpy.where(_CORNER_IS_MAX[index], maxs[rows], mins[rows])
+
+    starts = numpy.zeros((len(selected), 3), numpy.float32)
+    ends = numpy.zeros((len(selected), 3), numpy.float32)
+    for i, side in enumerate(Sides):
+        rows = has_side & (side_index == i)
+        if not rows.any(): continue
+
+        origin = numpy.array(tuple(bound_box[side.start_vertex]), numpy.float32)
+        transform = numpy.dot(_matrix3(normalize), _matrix3(side.projection)).T
+        starts[rows] = numpy.dot(corner(side.start_vertex, rows) - origin, transform)
+        ends[rows] = numpy.dot(corner(side.end_vertex, rows) - origin, transform)
+
+    return [(Sides[i].name, float(start[0]), float(start[1]), float(end[0]), float(end[1]))
+            for i, start, end in zip(side_index[has_side], starts[has_side], ends[has_side])]
+
+# mount-points closer than this are considered to touch
+_EPSILON = 1e-4
+
+def coalesce_mount_points(mount_points) -> list:
+    """
+    Merges the mount-points of each side whose union is again a rectangle, as with a subdivided mount-surface,
+    and drops those that lie within another one. The result covers the same area of each side.
+    """
+    by_side = OrderedDict()
+    for side, startx, starty, endx, endy in mount_points:
+        by_side.setdefault(side, []).append((startx, starty, endx, endy))
+
+    coalesced = []
+    for side, rects in by_side.items():
+        # a side's projection always orders start and end the same way, keep it that way
+        flipx = rects[0][0] > rects[0][2]
+        flipy = rects[0][1] > rects[0][3]
+        boxes = [(min(sx, ex), min(sy, ey), max(sx, ex), max(sy, ey)) for sx, sy, ex, ey in rects]
+        for x0, y0, x1, y1 in _coalesce_boxes(boxes):
+            coalesced.append((side,
+                x1 if flipx else x0, y1 if flipy else y0,
+                x0 if flipx else x1, y0 if flipy else y1))
+
+    return coalesced
+
+def _coalesce_boxes(boxes):
+    boxes = _drop_contained(boxes)
+    while True:
+        merged = _merge_runs(_merge_runs(boxes, X), Y)
+        if len(merged) == len(boxes):
+            return merged
+        boxes = _drop_contained(merged)
+
+def _merge_runs(boxes, axis):
+    """
+    Merges the boxes that have the same extent across the given axis and touch or overlap along it.
+    """
+    lo, hi = axis, axis + 2
+    across = (1 - axis, 3 - axis)
+
+    rows = OrderedDict()
+    for box in boxes:
+        key = tuple(round(box[i] / _EPSILON) for i in across)
+        rows.setdefault(key, []).append(box)
+
+    merged = []
+    for row in rows.values():
+        row.sort(key=lambda box: box[lo])
+        current = list(row[0])
+        for box in row[1:]:
+            if box[lo] <= current[hi] + _EPSILON:
+                current[hi] = max(current[hi], box[hi])
+            else:
+                merged.append(tuple(current))
+                current = list(box)
+        merged.append(tuple(current))
+    return merged
+
+def _drop_contained(boxes):
+    def contains(outer, inner):
+        return outer[0] - _EPSILON <= inner[0] and outer[1] - _EPSILON <= inner[1] and \
+               inner[2] <= outer[2] + _EPSILON and inner[3] <= outer[3] + _EPSILON
+
+    kept = []
+    for box in sorted(boxes, key=lambda b: (b[2] - b[0]) * (b[3] - b[1]), reverse=True):
+        if not any(contains(outer, box) for outer in kept):
+            kept.append(box)
+    return kept
+
 def _floatstr(f):
     return ("%.2f" % (f)).replace('-0.00', '0.00')
 
@@ -189,18 +332,144 @@ def draw_box(verts):
     glEnd()
 
 def draw_block_box():
-    if not show_block_bounds():
+    if show_block_bounds():
+        box = block_bounds()
+        color = bpy.context.user_preferences.themes[0].view_3d.object_selected
+
+        glLineWidth(1.0)
+        glColor3f(*color)
+        glLineStipple(1, 0x3333)
+        glEnable(GL_LINE_STIPPLE)
+        draw_box(box)
+        glDisable(GL_LINE_STIPPLE)
+
+    if show_mount_points():
+        mount_point_overlay.draw()
+
+# ------------------------------------ draw mount-points ------------------------------------------- #
+
+# keeps the overlay from flickering against the surfaces the mount-points were taken from
+_OVERLAY_OFFSET = 0.002
+
+def overlay_objects(scn) -> list:
+    """
+    The objects that the default export takes mount-points from: those on the scene's mount-point layers.
+    """
+    mp_layers = data(scn).mount_points_layers
+    return [ob for ob in scn.objects if 'MESH' == ob.type and layers_overlap(ob.layers, mp_layers)]
+
+def mount_point_quad(mount_point) -> list:
+    """
+    Turns a mount-point back into the four corners of its rectangle on the block bounds, in world-space.
+    """
+    side_name, startx, starty, endx, endy = mount_point
+    side = next(side for side in Sides if side.name == side_name)
+
+    # the projections only swap and negate axes, so the transposed matrix reverses them
+    unproject = side.projection.transposed() * Matrix.Scale(0.5 if is_small_block() else 2.5, 4)
+    origin = block_bounds()[side.start_vertex] + side.normal * _OVERLAY_OFFSET
+
+    return [origin + unproject * Vector((x, y, 0.0))
+            for x, y in ((startx, starty), (endx, starty), (endx, endy), (startx, endy))]
+
+class MountPointOverlay:
+    """
+    Draws the mount-points as they would be exported onto the sides of the block bounds.
+    The rectangles are extracted by update() from the scene_update_post handler, because that creates and removes
+    meshes, which must not happen while Blender draws. draw() only compiles them into an OpenGL display-list
+    once and then calls it. So a redraw costs the same regardless of mesh size.
+    """
+
+    def __init__(self):
+        self.display_list = None
+        self.quads = []
+        self.state = None
+        self.is_dirty = True
+        self.needs_compile = True
+
+    def invalidate(self):
+        self.is_dirty = True
+
+    def current_state(self, scn, objects: list) -> tuple:
+        # objects moved onto or off the mount-point layers aren't necessarily updated, so their names are compared
+        d = data(scn)
+        return (scn.name, tuple(d.block_dimensions), d.block_size, tuple(d.mount_points_layers),
+                frozenset(ob.name for ob in objects))
+
+    def update(self) -> bool:
+        """
+        Extracts the rectangles again if the mount-point objects or the block changed since the last time.
+        Returns whether they were extracted.
+        """
+        if not show_mount_points():
+            self.state = None # extract them again once they are shown
+            return False
+
+        scn = scene()
+        objects = overlay_objects(scn)
+        state = self.current_state(scn, objects)
+        if not self.is_dirty and state == self.state:
+            return False
+
+        self.quads = [mount_point_quad(mp) for mp in coalesce_mount_points(mount_point_definitions(objects))]
+        self.state = state
+        self.is_dirty = False
+        self.needs_compile = True
+        return True
+
+    def draw(self):
+        if self.display_list is None:
+            self.display_list = glGenLists(1)
+            self.needs_compile = True
+        if self.needs_compile:
+            self.compile()
+            self.needs_compile = False
+        glCallList(self.display_list)
+
+    def compile(self):
+        r, g, b = mount_point_color()
+
+        glNewList(self.display_list, GL_COMPILE)
+        glEnable(GL_BLEND)
+        glColor4f(r, g, b, 0.25)
+        glBegin(GL_QUADS)
+        for quad in self.quads:
+            for v in quad:
+                glVertex3f(*v)
+        glEnd()
+        glDisable(GL_BLEND)
+
+        glColor3f(r, g, b)
+        for quad in self.quads:
+            glBegin(GL_LINE_LOOP)
+            for v in quad:
+                glVertex3f(*v)
+            glEnd()
+        glEndList()
+
+    def free(self):
+        if self.display_list is not None:
+            glDeleteLists(self.display_list, 1)
+            self.display_list = None
+        self.quads = []
+        self.state = None
+        self.is_dirty = True
+
+mount_point_overlay = MountPointOverlay()
+
+@bpy.app.handlers.persistent
+def update_mount_point_overlay(scn):
+    if not data(scn):
         return
 
-    box = block_bounds()
-    color = bpy.context.user_preferences.themes[0].view_3d.object_selected
+    if bpy.data.objects.is_updated:
+        for ob in overlay_objects(scn):
+            if ob.is_updated or ob.is_updated_data:
+                mount_point_overlay.invalidate()
+                break
 
-    glLineWidth(1.0)
-    glColor3f(*color)
-    glLineStipple(1, 0x3333)
-    glEnable(GL_LINE_STIPPLE)
-    draw_box(box)
-    glDisable(GL_LINE_STIPPLE)
+    if mount_point_overlay.update():
+        tag_view3d_for_redraw()
 
 def tag_view3d_for_redraw():
     for window in bpy.context.window_manager.windows:
@@ -217,6 +486,8 @@ def enable_draw_callback():
 
     if not handle_block_box:
         handle_block_box = bpy.types.SpaceView3D.draw_handler_add(draw_block_box, (), 'WINDOW', 'POST_VIEW')
+    if not update_mount_point_overlay in bpy.app.handlers.scene_update_post:
+        bpy.app.handlers.scene_update_post.append(update_mount_point_overlay)
 
     tag_view3d_for_redraw()
 
@@ -227,5 +498,8 @@ def disable_draw_callback():
     if handle_block_box:
         bpy.types.SpaceView3D.draw_handler_remove(handle_block_box, 'WINDOW')
         handle_block_box = None
+    if update_mount_point_overlay in bpy.app.handlers.scene_update_post:
+        bpy.app.handlers.scene_update_post.remove(update_mount_point_overlay)
+    mount_point_overlay.free()
 
     tag_view3d_for_redraw()
@@ -2,9 +2,9 @@ from itertools import chain
 import bpy
 import re
 import shutil
-from os.path import join, dirname
+from os.path import join, dirname, isfile, basename
 from os import makedirs
-from subprocess import CalledProcessError
+from subprocess import SubprocessError
 from string import Template
 from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
 from bpy_extras.io_utils import path_reference_mode, orientation_helper_factory
@@ -13,8 +13,13 @@ from .mirroring import mirroringAxisFromObjectName
 from .texture_files import TextureType
 from .types import sceneData, data, SEMaterialInfo
 from .utils import layer_bits, layer_bit, scene, first, PinnedScene, reportMessage, exportSettings
-from .export import ExportSettings, export_fbx, fbx_to_hkt, hkt_filter, write_pretty_xml, mwmbuilder, generateBlockDefXml
+from .fbx import shouldScaleDownEmpty
+from .export import ExportSettings, export_fbx, havok_converter, write_pretty_xml, mwmbuilder, generateBlockDefXml, \
+    DeferredOutcome, resolveOutcome
 from .mwmbuilder import material_xml, mwmbuilder_xml, lod_xml
+from .manifest import Fingerprint, fingerprintCollisionObject
+from .havok_options import HAVOK_OPTION_FILE_CONTENT
+from xml.etree import ElementTree
 
 
 COLOR_OBJECTS_SKT  = (.50, .65, .80, 1)
@@ -34,6 +39,15 @@ MESH_LIKE_TYPES = {'CURVE', 'SURFACE', 'FONT', 'META'}
 
 ACCEPTABLE_OUTCOME = {'SUCCESS', 'PROBLEMS'}
 
+def isAcceptable(outcome) -> bool:
+    """
+    An outcome that is still being produced in the background is optimistically considered acceptable.
+    Should it fail after all, that is reported once the outcome is resolved.
+    """
+    if isinstance(outcome, DeferredOutcome) and not outcome.isDone():
+        return True
+    return resolveOutcome(outcome) in ACCEPTABLE_OUTCOME
+
 class BlockExportTree(bpy.types.NodeTree):
     bl_idname = "SEBlockExportTree"
     bl_label = "Block Export Settings"
@@ -464,16 +478,56 @@ class HavokFileNode(bpy.types.Node, SENode, Exporter, ReadyState):
             settings.text("layers had no collision-objects for export", file=hktfile, node=self)
             return settings.cacheValue(hktfile, 'SKIPPED')
 
+        fingerprint = None
+        if settings.manifest:
+            fingerprint = settings.cacheValue(hktfile + "|fingerprint", self.fingerprint(settings, objectsSource.getObjects()))
+            outcome = settings.manifest.lookup(hktfile, fingerprint)
+            if outcome:
+                settings.info("unchanged since the last export", file=hktfile, node=self)
+                return settings.cacheValue(hktfile, outcome)
+
+        contentKey = None
+        if settings.hktCache:
+            contentKey = self.contentKey(settings, objectsSource.getObjects())
+            if settings.hktCache.fetch(contentKey, hktfile, '.hkt'):
+                settings.info("identical collision model found in the cache", file=hktfile, node=self)
+                return settings.cacheValue(hktfile, settings.recordOutcome(hktfile, fingerprint, 'SUCCESS'))
+
         export_fbx(settings, fbxfile, objectsSource.getObjects())
-        try:
-            fbx_to_hkt(settings, fbxfile, hktfile)
-            hkt_filter(settings, hktfile, hktfile)
-        except CalledProcessError as e:
-            settings.error(str(e), file=hktfile, node=self)
-            return settings.cacheValue(hktfile, 'FAILED')
 
-        settings.info("export successful", file=hktfile, node=self)
-        return settings.cacheValue(hktfile, 'SUCCESS')
+        def resolve(future):
+            try:
+                future.result()
+            except (SubprocessError, OSError) as e: # also tools that couldn't be started
+                settings.error(str(e), file=hktfile, node=self)
+                return settings.recordOutcome(hktfile, fingerprint, 'FAILED')
+
+            if contentKey:
+                settings.hktCache.put(contentKey, hktfile, '.hkt')
+            settings.info("export successful", file=hktfile, node=self)
+            return settings.recordOutcome(hktfile, fingerprint, 'SUCCESS')
+
+        outcome = DeferredOutcome(havok_converter(settings, fbxfile, hktfile, self), resolve)
+        return settings.cacheValue(hktfile, outcome.result() if outcome.isDone() else outcome)
+
+    def fingerprint(self, settings: ExportSettings, objects) -> str:
+        fp = Fingerprint()
+        fp.update(settings.CubeSize, settings.scaleDown, HAVOK_OPTION_FILE_CONTENT)
+        fp.updateTool(settings.fbximporter)
+        fp.updateTool(settings.havokfilter)
+        fp.updateObjects(settings.scene, objects, meshes=settings.meshes)
+        return fp.hexdigest()
+
+    def contentKey(self, settings: ExportSettings, objects) -> str:
+        """
+        Identifies the collision model by its content alone, regardless of scene, cube-size and object names.
+        """
+        fp = Fingerprint()
+        fp.update(settings.scaleDown, HAVOK_OPTION_FILE_CONTENT)
+        fp.updateTool(settings.fbximporter)
+        fp.updateTool(settings.havokfilter)
+        fp.update(*sorted(fingerprintCollisionObject(settings.scene, o, meshes=settings.meshes) for o in objects))
+        return fp.hexdigest()
 
 
 IOFBXOrientationHelper = orientation_helper_factory("IOFBXOrientationHelper", axis_forward='Z', axis_up='Y') # SE; -Z, Y
@@ -891,7 +945,7 @@ class MwmFileNode(bpy.types.Node, SENode, Exporter, ReadyState, Upgradable):
         msgs = []
         for i, socket in enumerate(sockets):
             lodName = socket.getText(settings)
-            if socket.isReady() and socket.export(settings) in ACCEPTABLE_OUTCOME:
+            if socket.isReady() and isAcceptable(socket.export(settings)):
                 lodDistance = socket.distance
                 renderQualities = socket.qualities if socket.use_qualities else None
                 lods_xml.append(lod_xml(settings, lodName, lodDistance, renderQualities))
@@ -902,10 +956,14 @@ class MwmFileNode(bpy.types.Node, SENode, Exporter, ReadyState, Upgradable):
             settings.text(msg, file=mwmfile, node=self)
 
         havokfile = None
+        havokJob = None
         socket = self.inputs['Havok']
-        if socket.isReady() and socket.export(settings) in ACCEPTABLE_OUTCOME:
+        havokOutcome = socket.export(settings) if socket.isReady() else None
+        if havokOutcome and isAcceptable(havokOutcome):
             sourceName = socket.getText(settings)
             havokfile = join(settings.outputDir, sourceName + ".hkt")
+            if isinstance(havokOutcome, DeferredOutcome) and not havokOutcome.isDone():
+                havokJob = havokOutcome.future
         else:
             settings.info("no collision data included", file=mwmfile, node=self)
 
@@ -918,25 +976,104 @@ class MwmFileNode(bpy.types.Node, SENode, Exporter, ReadyState, Upgradable):
                 settings.error("Mesh-object '%s' has no UV-map. This will crash SE's DirectX 11 renderer." % o.name, file=mwmfile, node=self)
         materials_xml = [material_xml(settings, m, mwmfile, self) for m in materials.values()]
 
+        fbxfile = join(settings.outputDir, name + ".fbx")
+        rescaleFactor = self.mwm_settings.rescale_factor
+        largeFbxfile = self.largeFbxFile(settings, objectsSource.getObjects())
+        if largeFbxfile:
+            rescaleFactor *= 0.2 # MwmBuilder does the scaling down instead of the FBX export
+
         paramsfile = join(settings.outputDir, name + ".xml")
-        paramsxml = mwmbuilder_xml(settings, materials_xml, lods_xml, self.mwm_settings.rescale_factor, self.mwm_settings.rotation_y)
-        write_pretty_xml(paramsxml, paramsfile)
+        with settings.span('mwmbuilder_xml', node=self, file=name + ".xml"):
+            paramsxml = mwmbuilder_xml(settings, materials_xml, lods_xml, rescaleFactor, self.mwm_settings.rotation_y)
+            settings.countWritten(write_pretty_xml(paramsxml, paramsfile))
+
+        # without running mwmbuilder there is no result that could be reused
+        fingerprint = None
+        if settings.manifest and settings.isRunMwmbuilder:
+            fingerprint = self.fingerprint(settings, objectsSource.getObjects(), paramsxml, havokfile)
+            outcome = settings.manifest.lookup(mwmfile, fingerprint)
+            if outcome:
+                if settings.hadErrors:
+                    outcome = 'PROBLEMS'
+                settings.info("unchanged since the last export", file=mwmfile, node=self)
+                if isfile(fbxfile):
+                    self.rememberLargeFbxFile(settings, fbxfile, objectsSource.getObjects())
+                return settings.cacheValue(mwmfile, outcome)
+
+        if largeFbxfile:
+            fbxfile = largeFbxfile
+            settings.text("rescaling %s of the large block" % basename(fbxfile), file=mwmfile, node=self)
+        else:
+            export_fbx(settings, fbxfile, objectsSource.getObjects(), self.fbx_settings)
+            self.rememberLargeFbxFile(settings, fbxfile, objectsSource.getObjects())
 
-        fbxfile = join(settings.outputDir, name + ".fbx")
-        export_fbx(settings, fbxfile, objectsSource.getObjects(), self.fbx_settings)
+        hadErrors = settings.hadErrors # MwmBuilder might still be running when the next node is exported
 
-        try:
-            mwmbuilder(settings, fbxfile, havokfile, paramsfile, mwmfile)
-        except CalledProcessError as e:
-            settings.error(str(e), file=mwmfile, node=self)
-            return settings.cacheValue(mwmfile, 'FAILED')
-
-        if not settings.hadErrors:
-            settings.info("export successful", file=mwmfile, node=self)
-            return settings.cacheValue(mwmfile, 'SUCCESS')
+        def resolve(future):
+            recordedFingerprint = fingerprint
+            try:
+                includedHavokfile = future.result()
+            except (SubprocessError, OSError) as e: # also tools that couldn't be started
+                settings.error(str(e), file=mwmfile, node=self)
+                return settings.recordOutcome(mwmfile, recordedFingerprint, 'FAILED')
+
+            if havokfile and not includedHavokfile:
+                settings.info("no collision data included, the Havok conversion failed", file=mwmfile, node=self)
+                recordedFingerprint = None # the model needs to be regenerated together with its collision data
+
+            if not hadErrors:
+                settings.info("export successful", file=mwmfile, node=self)
+                return settings.recordOutcome(mwmfile, recordedFingerprint, 'SUCCESS')
+            else:
+                settings.warn("export completed with problems", file=mwmfile, node=self)
+                return settings.recordOutcome(mwmfile, recordedFingerprint, 'PROBLEMS')
+
+        outcome = DeferredOutcome(mwmbuilder(settings, fbxfile, havokfile, paramsfile, mwmfile, havokJob, self), resolve)
+        return settings.cacheValue(mwmfile, outcome.result() if outcome.isDone() else outcome)
+
+    def rememberLargeFbxFile(self, settings: ExportSettings, fbxfile: str, objects):
+        if settings.CubeSize == 'Large' and not settings.scaleDown:
+            settings.largeFbxFiles[self.name] = (fbxfile, frozenset(o.name for o in objects))
+
+    def largeFbxFile(self, settings: ExportSettings, objects) -> str:
+        """
+        With the scene's 'Reuse Large Model' option a scaled-down export lets MwmBuilder rescale the .fbx file
+        that was written for the large block instead of writing another one. That requires the same objects.
+        Scaled-down empties are scaled differently than the rest, a model with those needs an .fbx file of its own.
+        """
+        if not settings.scaleDown or not settings.sceneData.use_large_fbx_for_small:
+            return None
+
+        fbxfile, objectNames = settings.largeFbxFiles.get(self.name, (None, None))
+        if fbxfile is None or not isfile(fbxfile):
+            return None
+
+        objects = list(objects)
+        if objectNames != frozenset(o.name for o in objects):
+            return None
+        if any(o.type == 'EMPTY' and shouldScaleDownEmpty(o) for o in objects):
+            return None
+
+        return fbxfile
+
+    def fingerprint(self, settings: ExportSettings, objects, paramsxml: ElementTree.Element, havokfile: str) -> str:
+        fp = Fingerprint()
+        fp.update(settings.CubeSize, settings.scaleDown, settings.isUseTangentSpace)
+        fp.updateProperties(self.fbx_settings)
+        fp.updateProperties(self.mwm_settings)
+        fp.updateBytes(ElementTree.tostring(paramsxml, encoding='utf-8', method='ordered-attribs'))
+        if havokfile:
+            # the .hkt file might still be in the making, so prefer the fingerprint of its inputs
+            havokFingerprint = settings.cache.get(havokfile + "|fingerprint", None)
+            if havokFingerprint:
+                fp.update(havokFingerprint)
+            else:
+                fp.updateFile(havokfile)
         else:
-            settings.warn("export completed with problems", file=mwmfile, node=self)
-            return settings.cacheValue(mwmfile, 'PROBLEMS')
+            fp.update(None)
+        fp.updateTool(settings.mwmbuilder)
+        fp.updateObjects(settings.scene, objects, meshes=settings.meshes)
+        return fp.hexdigest()
 
 PATTERN_NAME = re.compile(r"^(.*?)(\.\d+)?$")
 
@@ -1243,7 +1380,9 @@ class BlockDefinitionNode(bpy.types.Node, SENode, Exporter, ReadyState, Upgradab
         if blockdeffile in settings.cache:
             return settings.cache[blockdeffile]
 
-        write_pretty_xml(self.generateBlockDefXml(settings), blockdeffile)
+        xml = self.generateBlockDefXml(settings)
+        with settings.span('write_pretty_xml', node=self, file=name + ".blockdef.xml"):
+            settings.countWritten(write_pretty_xml(xml, blockdeffile))
         settings.info("export successful", file=blockdeffile, node=self)
         return settings.cacheValue(blockdeffile, "SUCCESS")
 
@@ -1283,14 +1422,17 @@ class BlockDefinitionNode(bpy.types.Node, SENode, Exporter, ReadyState, Upgradab
 
         mirrorSettings = settings.mirrorSettings()
 
-        xml = generateBlockDefXml(
-            settings,
-            modelFile,
-            iconFile,
-            mountPointsSocket.getObjects(),
-            mirroringSocket.getObjects(),
-            mirrorSettings.SubtypeId if mirrorSettings else None,
-            constrModelFiles)
+        with settings.span('generateBlockDefXml', node=self):
+            xml = generateBlockDefXml(
+                settings,
+                modelFile,
+                iconFile,
+                mountPointsSocket.getObjects(),
+                mirroringSocket.getObjects(),
+                mirrorSettings.SubtypeId if mirrorSettings else None,
+                constrModelFiles,
+                file=blockdeffile,
+                node=self)
 
         return settings.cacheValue(blockdeffilecontent, xml)
 
@@ -4,17 +4,21 @@ from subprocess import CalledProcessError
 from tempfile import TemporaryDirectory
 import bpy
 from bpy.utils import register_class, unregister_class
-from .export import ExportSettings, MissbehavingToolError
+from .export import ExportSettings, MissbehavingToolError, ToolRunner, resolveOutcome
 from .mirroring import setupMirrors
-from .merge_xml import CubeBlocksMerger, MergeResult
+from .merge_xml import CubeBlocksMerger, CubeBlocksPatcher, ModDefinitionsMerger, MergeResult, find_data_dir
+from .manifest import ExportManifest
 from .mount_points import create_mount_point_skeleton
 from .pbr_node_group import getDx11Shader, createDx11ShaderGroup
 from .types import upgradeToNodeMaterial
-from .types import getExportNodeTreeFromContext, getExportNodeTree, data, sceneData, SEMaterialInfo
-from .nodes import BlockDefinitionNode, Exporter, BlockExportTree, getBlockDef, LayerObjectsNode, SeparateLayerObjectsNode, \
+from .texture_files import imageIndex
+from .types import getExportNodeTreeFromContext, getExportNodeTree, data, sceneData, SEMaterialInfo, prefs
+from .nodes import BlockDefinitionNode, BlockExportTree, getBlockDef, LayerObjectsNode, SeparateLayerObjectsNode, \
     getUsedMaterials
 from .utils import layers, layer_bits, layer_bit, PinnedScene, PinnedSettings
 from .default_nodes import createDefaultTree
+from .scheduler import ExportGraph, ExportCycleError
+from .tracing import Tracer, NULL_TRACER, TRACE_FILENAME
 
 # mapping (scene.block_size) -> (block_size_name, apply_scale_down)
 SIZES = {
@@ -27,7 +31,11 @@ class BlockExport:
     def __init__(self, settings: ExportSettings):
         self.settings = settings
 
-    def mergeBlockDefs(self, cubeBlocks: CubeBlocksMerger):
+    def blockDefs(self) -> list:
+        """
+        Generates the block-definition XML for every cube-size of the block as a list of (SubtypeId, xml).
+        The xml is None for sizes that could not be generated. The result is None if there is no block-definition node.
+        """
         settings = self.settings
 
         with PinnedScene(settings.scene):
@@ -40,54 +48,107 @@ class BlockExport:
 
                 if blockdefNode is None:
                     settings.error("No block-definition node in export node-tree '%s'" % (settings.exportNodes.name))
-                    return False
-
-                failed = False
-                for settings.CubeSize, settings.scaleDown in SIZES[settings.sceneData.block_size]:
-                    settings.cache.clear()
-
-                    try:
-                        xml = blockdefNode.generateBlockDefXml(settings)
-                    except ValueError as e:
-                        settings.error(str(e), node=blockdefNode)
-                        failed = True
-                        continue
-
-                    result = cubeBlocks.merge(xml)
-                    if MergeResult.NOT_FOUND in result:
-                        failed = True
-                        settings.warn("CubeBlocks.sbc contained no definition for SubtypeId [%s]" % (settings.SubtypeId))
-                    elif MergeResult.MERGED in result:
-                        settings.info("Updated SubtypeId [%s]" % (settings.SubtypeId))
+                    return None
+
+                blockDefs = []
+                try:
+                    for settings.CubeSize, settings.scaleDown in SIZES[settings.sceneData.block_size]:
+                        settings.cache.clear()
+
+                        try:
+                            xml = blockdefNode.generateBlockDefXml(settings)
+                        except ValueError as e:
+                            settings.error(str(e), node=blockdefNode)
+                            xml = None
+
+                        blockDefs.append((settings.SubtypeId, xml))
+                finally:
+                    settings.meshes.clear() # the mount-points were extracted from cached meshes
+
+        return blockDefs
+
+    def mergeBlockDefs(self, cubeBlocks: CubeBlocksMerger):
+        settings = self.settings
+
+        blockDefs = self.blockDefs()
+        if blockDefs is None:
+            return False
+
+        failed = False
+        for subtypeId, xml in blockDefs:
+            if xml is None:
+                failed = True
+                continue
+
+            result = cubeBlocks.merge(xml)
+            if MergeResult.NOT_FOUND in result:
+                failed = True
+                settings.warn("CubeBlocks.sbc contained no definition for SubtypeId [%s]" % (subtypeId))
+            elif MergeResult.MERGED in result:
+                settings.info("Updated SubtypeId [%s]" % (subtypeId))
 
         return not failed
 
     def export(self):
+        """
+        Runs all export-nodes for every cube-size of the block.
+        Returns the names of the skipped, failed and problematic export-nodes.
+        """
         settings = self.settings
 
         skips = OrderedDict()
         failures = OrderedDict()
         problems = OrderedDict()
 
+        results = []
+
         with PinnedScene(settings.scene):
             with PinnedSettings(settings):
-                for settings.CubeSize, settings.scaleDown in SIZES[settings.sceneData.block_size]:
-                    settings.cache.clear()
+                try:
+                    tasks = ExportGraph(settings.exportNodes, SIZES[settings.sceneData.block_size]).schedule()
+                except ExportCycleError as e:
+                    settings.error(str(e))
+                    tasks = []
+                    for task in e.tasks:
+                        failures[task.name] = task.node
+
+                size = None
+                try:
+                    for task in tasks:
+                        if task.size != size:
+                            size = task.size
+                            settings.CubeSize, settings.scaleDown = size
+                            settings.cache.clear()
+
+                            self.ensureAtLeastOneTextureSlot(getUsedMaterials())
+
+                        with settings.span(task.name, 'node', node=task.node):
+                            results.append((task, task.run(settings)))
+                finally:
+                    settings.meshes.clear()
+
+                if settings.mwmBatch is not None:
+                    settings.mwmBatch.submit() # the models that didn't fill up a whole batch
+
+                # external tools may still be running, wait for them
+                for task, result in results:
+                    with settings.tracer.span('wait for tools', 'blender',
+                                              scene=settings.scene.name, CubeSize=task.size[0], node=task.node.name):
+                        result = resolveOutcome(result)
+                    if 'SKIPPED' == result:
+                        skips[task.name] = task.node
+                    elif 'FAILED' == result:
+                        failures[task.name] = task.node
+                    elif 'PROBLEMS' == result:
+                        problems[task.name] = task.node
 
-                    self.ensureAtLeastOneTextureSlot(getUsedMaterials())
+        if settings.manifest:
+            settings.manifest.save()
 
-                    for exporter in settings.exportNodes.nodes:
-                        if not isinstance(exporter, Exporter):
-                            continue
+        settings.pruneCaches()
 
-                        name = exporter.label if exporter.label else exporter.name
-                        result = exporter.export(settings)
-                        if 'SKIPPED' == result:
-                            skips[name] = exporter
-                        elif 'FAILED' == result:
-                            failures[name] = exporter
-                        elif 'PROBLEMS' == result:
-                            problems[name] = exporter
+        if settings.unchangedFiles:
+            settings.info("%d exported files had the same content as before and were left untouched." % settings.unchangedFiles)
 
         if skips:
             settings.info("Some export-nodes were skipped: %s" % list(skips.keys()))
@@ -96,6 +157,8 @@ class BlockExport:
         if failures:
             settings.error("Some export-nodes failed: %s" % list(failures.keys()))
 
+        return list(skips.keys()), list(failures.keys()), list(problems.keys())
+
 
     def ensureAtLeastOneTextureSlot(self, materials):
         """
@@ -141,6 +204,14 @@ class ExportSceneAsBlock(bpy.types.Operator):
     skip_mwmbuilder = bpy.props.BoolProperty(
         name="Skip mwmbuilder",
         description="Export intermediary files but do not run them through mwmbuilder")
+    use_incremental = bpy.props.BoolProperty(
+        name="Skip Unchanged",
+        description="Do not regenerate models whose objects, materials and settings did not change since the last export",
+        default=True)
+    use_trace = bpy.props.BoolProperty(
+        name="Write Trace",
+        description="Record how long each stage of the export takes into %s next to the .blend file" % TRACE_FILENAME,
+        default=False)
     use_tspace = bpy.props.BoolProperty(
         name="Tangent Space",
         description="Add binormal and tangent vectors, together with normal they form the tangent space "
@@ -183,6 +254,8 @@ class ExportSceneAsBlock(bpy.types.Operator):
         col = lay.column()
         col.prop(self, "all_scenes")
         col.prop(self, "skip_mwmbuilder")
+        col.prop(self, "use_incremental")
+        col.prop(self, "use_trace")
         # col.prop(self, "use_tspace")
 
     def execute(self, context):
@@ -199,7 +272,9 @@ class ExportSceneAsBlock(bpy.types.Operator):
             else:
                 scenes = [context.scene]
 
-            with TemporaryDirectory() as tmpDir:
+            tracer = Tracer() if self.use_trace else NULL_TRACER
+
+            with TemporaryDirectory() as tmpDir, ToolRunner(prefs().tool_processes) as toolRunner:
                 wm = context.window_manager
                 wm.progress_begin(0, len(scenes))
                 try:
@@ -213,6 +288,10 @@ class ExportSceneAsBlock(bpy.types.Operator):
                         settings.operator = self
                         settings.isRunMwmbuilder = not self.skip_mwmbuilder
                         settings.isUseTangentSpace = self.use_tspace
+                        settings.toolRunner = toolRunner
+                        settings.tracer = tracer
+                        if self.use_incremental:
+                            settings.manifest = ExportManifest(settings.outputDir)
 
                         BlockExport(settings).export()
 
@@ -220,6 +299,11 @@ class ExportSceneAsBlock(bpy.types.Operator):
                 finally:
                     wm.progress_end()
 
+            if self.use_trace:
+                tracePath = bpy.path.abspath('//' + TRACE_FILENAME)
+                tracer.write(tracePath)
+                self.report({'INFO'}, "Trace written to %s" % tracePath)
+
         except FileNotFoundError as e: # raised when the addon preferences are missing some tool paths
             self.report({'ERROR'}, "Configuration error: %s" % e)
 
@@ -248,10 +332,18 @@ class UpdateDefinitionsFromBlockScene(bpy.types.Operator):
     create_backup = bpy.props.BoolProperty(
         name="Backup Target File",
         description="Creates a backup of the target file before updating.")
+    whole_mod = bpy.props.BoolProperty(
+        name="Whole Mod",
+        description="Update the definitions in whichever .sbc file of the mod's Data directory contains them, "
+                    "not just in the selected file")
     allow_renames = bpy.props.BoolProperty(
         name="Update SubtypeIds",
         description="Renames the SubtypeId if a definition matches by BlockPairName and CubeSize. "
                     "Be aware that this is not backwards-compatible for players!")
+    use_trace = bpy.props.BoolProperty(
+        name="Write Trace",
+        description="Record how long each stage of the update takes into %s next to the .blend file" % TRACE_FILENAME,
+        default=False)
 
     settings_name = bpy.props.StringProperty(
         name="Used Settings",
@@ -285,32 +377,49 @@ class UpdateDefinitionsFromBlockScene(bpy.types.Operator):
 
         col = lay.column()
         col.prop(self, "all_scenes")
+        col.prop(self, "whole_mod")
         col.prop(self, "create_backup")
+        col.prop(self, "use_trace")
 
     def execute(self, context):
         path = bpy.path.abspath(self.filepath)
-        merger = CubeBlocksMerger(cubeBlocksPath=path, backup=self.create_backup)
+        if self.whole_mod:
+            merger = ModDefinitionsMerger(find_data_dir(path), backup=self.create_backup)
+            for brokenFile in merger.brokenFiles:
+                self.report({'WARNING'}, "Could not read %s" % brokenFile)
+            path = merger.dataDir
+        else:
+            merger = CubeBlocksPatcher(cubeBlocksPath=path, backup=self.create_backup)
 
         if self.all_scenes:
             scenes = [scene for scene in bpy.data.scenes if data(scene).is_block]
         else:
             scenes = [context.scene]
 
+        tracer = Tracer() if self.use_trace else NULL_TRACER
+
         wm = context.window_manager
         wm.progress_begin(0, len(scenes))
         try:
             for i, scene in enumerate(scenes):
                 settings = ExportSettings(scene)
                 settings.operator = self
+                settings.tracer = tracer
 
                 BlockExport(settings).mergeBlockDefs(merger)
 
                 wm.progress_update(i)
 
-            merger.write()
+            with tracer.span('CubeBlocksMerger.write', 'io', file=os.path.basename(path)):
+                merger.write()
         finally:
             wm.progress_end()
 
+        if self.use_trace:
+            tracePath = bpy.path.abspath('//' + TRACE_FILENAME)
+            tracer.write(tracePath)
+            self.report({'INFO'}, "Trace written to %s" % tracePath)
+
         return {'FINISHED'}
 
 class AddDefaultExportNodes(bpy.types.Operator):
@@ -495,6 +604,7 @@ class UpdatableToNodesMaterials(bpy.types.Operator):
     bl_label = "SE: Upgrade All Materials to use Nodes"
 
     def execute(self, context):
+        imageIndex.expire()
         count = 0
         for mat in getUsedMaterials():
             matInfo = SEMaterialInfo(mat)
@@ -515,6 +625,7 @@ class UpdateShadersAndNodesMaterials(bpy.types.Operator):
             createDx11ShaderGroup()
             self.report({'INFO'}, "DX11 shader updated.")
 
+        imageIndex.expire()
         count = 0
         for mat in getUsedMaterials():
             matInfo = SEMaterialInfo(mat)
@@ -539,6 +650,7 @@ class SetupMaterial(bpy.types.Operator):
             or (s.type == 'NODE_EDITOR' and s.tree_type == 'ShaderNodeTree' and isinstance(s.id, bpy.types.Material))
 
     def execute(self, context):
+        imageIndex.expire()
         s = context.space_data
         if s.type == 'PROPERTIES':
             upgradeToNodeMaterial(context.material)
@@ -0,0 +1,105 @@
+import heapq
+from .nodes import Exporter, ExportSocket
+
+class ExportCycleError(ValueError):
+    def __init__(self, tasks):
+        self.tasks = tasks
+
+    def __str__(self):
+        return "export-nodes depend on each other in a cycle: %s" % sorted(set(t.name for t in self.tasks))
+
+class ExportTask:
+    """
+    The export of one Exporter node for one cube-size.
+    """
+
+    def __init__(self, node: Exporter, size: tuple, sizeIndex: int, nodeIndex: int):
+        self.node = node
+        self.size = size # (CubeSize, scaleDown)
+        self.sizeIndex = sizeIndex
+        self.nodeIndex = nodeIndex
+        self.dependencies = []
+        self.dependents = []
+        self.height = 0 # length of the longest chain of tasks that depend on this one
+        self.outcome = None
+
+    @property
+    def name(self) -> str:
+        return self.node.label if self.node.label else self.node.name
+
+    def run(self, settings):
+        self.outcome = self.node.export(settings)
+        return self.outcome
+
+    def __lt__(self, other):
+        # tasks that more other tasks wait for go first so that their external tools start early
+        return (self.sizeIndex, -self.height, self.nodeIndex) < (other.sizeIndex, -other.height, other.nodeIndex)
+
+    def __repr__(self):
+        return "ExportTask(%s, %s)" % (self.name, self.size[0])
+
+class ExportGraph:
+    """
+    The export node-tree compiled into a graph of tasks, one per Exporter node and cube-size.
+    A task depends on the Exporter nodes that are linked to its ExportSocket inputs.
+    The tasks of different cube-sizes are independent of each other.
+
+    The graph only decides the order in which the tasks run and detects cycles. A running node still gets
+    the results of its inputs through ExportSocket.export(), which settings.cache answers because the
+    dependencies ran first, so no node is exported twice. The external tools are submitted by the nodes
+    themselves. A model waits for its collision data through the Future of the Havok job, not through
+    the graph, so that it doesn't wait for the models of its LODs.
+    """
+
+    def __init__(self, nodeTree, sizes):
+        self.tasks = []
+
+        for sizeIndex, size in enumerate(sizes):
+            tasksByNode = {}
+            for nodeIndex, node in enumerate(nodeTree.nodes):
+                if isinstance(node, Exporter):
+                    tasksByNode[node.name] = ExportTask(node, size, sizeIndex, nodeIndex)
+
+            for task in tasksByNode.values():
+                for socket in task.node.inputs:
+                    if not isinstance(socket, ExportSocket) or not socket.enabled or not socket.is_linked:
+                        continue
+                    source = socket.firstSource(type=Exporter)
+                    dependency = tasksByNode.get(source.node.name, None) if source else None
+                    if dependency and not dependency in task.dependencies:
+                        task.dependencies.append(dependency)
+                        dependency.dependents.append(task)
+
+            self.tasks.extend(sorted(tasksByNode.values(), key=lambda t: t.nodeIndex))
+
+    def _topologicalOrder(self, ready: list, pop, push) -> list:
+        waitingFor = {id(t): len(t.dependencies) for t in self.tasks}
+        order = []
+        while ready:
+            task = pop(ready)
+            order.append(task)
+            for dependent in task.dependents:
+                waitingFor[id(dependent)] -= 1
+                if waitingFor[id(dependent)] == 0:
+                    push(ready, dependent)
+
+        if len(order) < len(self.tasks):
+            done = set(id(t) for t in order)
+            raise ExportCycleError([t for t in self.tasks if not id(t) in done])
+        return order
+
+    def schedule(self) -> list:
+        """
+        Orders the tasks so that every task comes after its dependencies and all tasks of a cube-size
+        come before those of the next. Within a cube-size the tasks that head the longest chains go first,
+        which starts their external tools earlier. Raises an ExportCycleError if there is no such order.
+        """
+        roots = [t for t in self.tasks if not t.dependencies]
+
+        order = self._topologicalOrder(list(roots), lambda l: l.pop(0), list.append)
+        for task in reversed(order):
+            task.height = max((d.height + 1 for d in task.dependents), default=0)
+
+        heap = list(roots)
+        heapq.heapify(heap)
+        return self._topologicalOrder(heap, heapq.heappop, heapq.heappush)
@@ -0,0 +1,142 @@
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+
+# ioctl request for cloning a whole file on Linux (btrfs, xfs), see ioctl_ficlone(2)
+_FICLONE = 0x40049409
+
+# the umask can only be read by changing it, which must not happen while other threads create files
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+def _reflink(srcfile: str, dstfile: str) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False # not available on Windows
+
+    try:
+        with open(srcfile, 'rb') as src, open(dstfile, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(dstfile)
+        except OSError:
+            pass
+        return False
+
+def stage_file(srcfile: str, dstfile: str, allowLink=True) -> str:
+    """
+    Makes the content of srcfile available as dstfile as cheaply as possible: as a hardlink, as a
+    copy-on-write clone or, if the file-system supports neither, as a plain copy.
+    Unless allowLink is False dstfile must not be modified afterwards because it might share its data with srcfile.
+    Returns how the file was staged: 'link', 'reflink' or 'copy'.
+    """
+    try:
+        os.remove(dstfile)
+    except FileNotFoundError:
+        pass
+
+    if allowLink:
+        try:
+            os.link(srcfile, dstfile)
+            return 'link'
+        except (OSError, AttributeError): # different volumes, no support by the file-system or no os.link at all
+            pass
+
+    if _reflink(srcfile, dstfile):
+        return 'reflink'
+
+    shutil.copyfile(srcfile, dstfile)
+    return 'copy'
+
+def collect_file(srcfile: str, dstfile: str) -> str:
+    """
+    Moves the result of a tool from its working directory to dstfile, replacing an existing file.
+    Falls back to a copy if the two are on different volumes.
+    Returns how the file was collected: 'move' or 'copy'.
+    """
+    try:
+        os.replace(srcfile, dstfile)
+        return 'move'
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    shutil.copy2(srcfile, dstfile)
+    os.remove(srcfile)
+    return 'copy'
+
+def match_file_mode(tmpfile: str, dstfile: str):
+    """
+    Gives tmpfile, which is about to replace dstfile, the permissions of dstfile or, if there is no dstfile yet,
+    those of a file newly created with open(). tempfile.mkstemp() creates files only their owner may read.
+    """
+    try:
+        shutil.copymode(dstfile, tmpfile)
+    except FileNotFoundError:
+        os.chmod(tmpfile, 0o666 & ~_UMASK)
+
+def _file_digest(filepath: str) -> bytes:
+    md5 = hashlib.md5()
+    with open(filepath, 'rb') as f:
+        for buf in iter(lambda: f.read(65536), b''):
+            md5.update(buf)
+    return md5.digest()
+
+def has_content(filepath: str, size: int, digest) -> bool:
+    """
+    Checks whether filepath exists with the given size and md5 digest. digest is only called if the sizes match.
+    """
+    try:
+        if os.stat(filepath).st_size != size:
+            return False
+        return _file_digest(filepath) == digest()
+    except OSError:
+        return False
+
+def write_if_changed(filepath: str, content: bytes) -> bool:
+    """
+    Replaces filepath with content unless it already has exactly that content, so that unchanged files keep
+    their modification time. The content is written to a temporary file next to filepath and renamed,
+    so nobody ever sees a partially written file. Returns whether the file was written.
+    """
+    if has_content(filepath, len(content), lambda: hashlib.md5(content).digest()):
+        return False
+
+    fd, tmpfile = tempfile.mkstemp(prefix='.', suffix=os.path.splitext(filepath)[1], dir=os.path.dirname(filepath))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        match_file_mode(tmpfile, filepath)
+        os.replace(tmpfile, filepath)
+    except:
+        try:
+            os.remove(tmpfile)
+        except OSError:
+            pass
+        raise
+    return True
+
+def replace_if_changed(srcfile: str, dstfile: str) -> bool:
+    """
+    Like collect_file() but leaves dstfile alone and just removes srcfile if both have the same content.
+    Returns whether dstfile was replaced.
+    """
+    if has_content(dstfile, os.stat(srcfile).st_size, lambda: _file_digest(srcfile)):
+        os.remove(srcfile)
+        return False
+
+    if os.path.exists(dstfile):
+        match_file_mode(srcfile, dstfile)
+    collect_file(srcfile, dstfile)
+    return True
+
+def same_volume(path1: str, path2: str) -> bool:
+    try:
+        return os.stat(path1).st_dev == os.stat(path2).st_dev
+    except OSError:
+        return False
@@ -3,6 +3,7 @@ from enum import Enum
 from itertools import groupby
 import os
 import re
+import time
 import bpy
 
 _RE_DIFFUSE = re.compile(r"_[dm]e\.dds$", re.IGNORECASE)
@@ -91,14 +92,21 @@ def textureFileNameFromPath(filepath: str) -> TextureFileName:
         extension = match.group('extension').lower(),
     )
 
+def _fileNames(dirpath: str):
+    try:
+        scandir = os.scandir
+    except AttributeError:
+        return os.listdir(dirpath) # Python < 3.5
+    return [entry.name for entry in scandir(dirpath)]
+
 def textureFilesFromPath(dirpath: str, acceptedExtensions={'dds'}) -> dict:
     """
     Builds a map of maps {basename -> {TextureType -> TextureFileName}} for all the files in the given directory.
     Files for which no TextureType can be determined will not be included.
     """
     try:
-        files = (textureFileNameFromPath(os.path.join(dirpath, f)) for f in os.listdir(dirpath))
-    except FileNotFoundError:
+        files = [textureFileNameFromPath(os.path.join(dirpath, f)) for f in _fileNames(dirpath)]
+    except (FileNotFoundError, NotADirectoryError):
         return {} # an image.filepath might not actually exist
     files = filter(lambda f: f and f.textureType and f.extension in acceptedExtensions, files)
     # for files with equal basename and equivalent texture-type this chooses the longest filename (as most descriptive)
@@ -107,20 +115,123 @@ def textureFilesFromPath(dirpath: str, acceptedExtensions={'dds'}) -> dict:
     files = {basename : {f.textureType : f for f in groupedFiles} for basename, groupedFiles in files}
     return files
 
+# file-systems like FAT only store modification-times with a resolution of two seconds
+_MTIME_GRANULARITY = 2.0
+
+class TextureCatalog:
+    """
+    Remembers the result of textureFilesFromPath() for each directory until the directory's modification-time
+    changes, which it does whenever a file in it is added, removed or renamed.
+    The provided maps are shared and must not be modified.
+    """
+
+    def __init__(self):
+        self.directories = {} # (dirpath, extensions) -> (mtime, {basename -> {TextureType -> TextureFileName}})
+
+    def textureFiles(self, dirpath: str, acceptedExtensions={'dds'}) -> dict:
+        key = (os.path.normcase(os.path.abspath(dirpath)), frozenset(acceptedExtensions))
+        try:
+            mtime = os.stat(dirpath).st_mtime
+        except OSError:
+            self.directories.pop(key, None)
+            return {}
+
+        entry = self.directories.get(key, None)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+
+        scanned = time.time()
+        files = textureFilesFromPath(dirpath, acceptedExtensions)
+        # a directory that changed just before it was scanned might change again within the same mtime-tick
+        if mtime < scanned - _MTIME_GRANULARITY:
+            self.directories[key] = (mtime, files)
+        else:
+            self.directories.pop(key, None)
+        return files
+
+    def clear(self):
+        self.directories.clear()
+
+# shared by all materials, so each texture directory is only scanned once per Blender session
+textureCatalog = TextureCatalog()
+
+def _imageKey(filepath: str) -> str:
+    return os.path.normcase(os.path.normpath(bpy.path.abspath(filepath)))
+
+class ImageIndex:
+    """
+    Finds the bpy.types.Image of a file without comparing the filepath of every image in the .blend.
+    The index is rebuilt when images were added or removed behind its back and after a .blend was loaded.
+    As filepaths can change without the number of images changing, the first lookup that misses after
+    expire() rebuilds it once more; operators call expire() before they look up images.
+    It only keeps the names of the images because references to them don't survive loading a .blend.
+    """
+
+    def __init__(self):
+        self.names = None # normalized absolute filepath -> image name
+        self.count = 0
+        self.current = False # no filepath changed since the index was rebuilt
+
+    def image(self, filepath: str) -> bpy.types.Image:
+        key = _imageKey(filepath)
+        if self.names is None or self.count != len(bpy.data.images):
+            self.rebuild()
+
+        image = self._validImage(key)
+        if image is None and not self.current:
+            # an image might have been renamed or pointed at another file since the index was built
+            self.rebuild()
+            image = self._validImage(key)
+        return image
+
+    def _validImage(self, key: str) -> bpy.types.Image:
+        name = self.names.get(key, None)
+        image = bpy.data.images.get(name, None) if name is not None else None
+        if image is not None and image.filepath and _imageKey(image.filepath) == key:
+            return image
+        return None
+
+    def add(self, image: bpy.types.Image):
+        if self.names is not None and image.filepath:
+            self.names.setdefault(_imageKey(image.filepath), image.name)
+            self.count = len(bpy.data.images)
+
+    def rebuild(self):
+        names = {}
+        for image in bpy.data.images:
+            if image.filepath:
+                names.setdefault(_imageKey(image.filepath), image.name) # the first one wins, as it always did
+        self.names = names
+        self.count = len(bpy.data.images)
+        self.current = True
+
+    def expire(self):
+        self.current = False
+
+    def invalidate(self):
+        self.names = None
+
+imageIndex = ImageIndex()
+
+@bpy.app.handlers.persistent
+def invalidateImageIndex(dummy):
+    imageIndex.invalidate()
+
 def imageFromFilePath(filepath):
     """
     Provides a bpy.types.Image for the given filepath.
     The function checks if there is an existing Image with such a filepath and loads a new one if there isn't.
     """
     filepath = bpy.path.abspath(filepath)
-    for image in bpy.data.images:
-        if image.filepath and bpy.path.abspath(image.filepath) == filepath:
-            return image
+    image = imageIndex.image(filepath)
+    if image is not None:
+        return image
     try:
         filepath = bpy.path.relpath(filepath)
     except ValueError:
         pass # .blend and image are on different drives, so fall back to using the absolute path
     image = bpy.data.images.load(filepath)
+    imageIndex.add(image)
     return image
 
 def matchingFileNamesFromFilePath(filepath):
@@ -133,7 +244,7 @@ def matchingFileNamesFromFilePath(filepath):
     if not textureFileName:
         return {}
 
-    allFilesInDir = textureFilesFromPath(os.path.dirname(filepath))
+    allFilesInDir = textureCatalog.textureFiles(os.path.dirname(filepath))
     matchingFiles = allFilesInDir.get(textureFileName.basename, None)
     return matchingFiles if matchingFiles else {}
 
@@ -0,0 +1,271 @@
+"""
+A long-running process that starts the external tools on behalf of the export. Where the tools run through
+a compatibility layer like Wine every start of a tool pays for starting that layer. The tool host is started
+once, keeps the layer warm and receives the tool invocations over a local TCP socket:
+
+    python toolhost.py [--listen 127.0.0.1:7850] [--launcher "wine"] [--warmup "wineserver --persistent"]
+
+Enter the address in the add-on preferences as "Tool Host" to have the export use it.
+The module only depends on the standard library so that it can be run by any Python 3 interpreter.
+
+Whoever can talk to the host can run any command as the user running it. So the host only listens on
+loopback-addresses unless started with --allow-remote, and it only accepts requests that carry the secret
+token from the file .space_engineers_toolhost_token in the user's home directory. The host creates that file, readable
+only by the user, on its first start.
+
+Protocol: the client sends a single line of JSON with the "token", the "cmdline" and the "cwd" of the tool.
+The host answers with frames of a 4-byte big-endian length followed by that many bytes, one frame per line
+of the tool's output. A frame of length 0 is followed by the tool's exit-code as a 4-byte signed integer.
+A frame of length 0xFFFFFFFF is followed by a frame with the reason why the tool could not be run at all.
+If the client shuts down its side of the connection the tool is stopped.
+"""
+
+import argparse
+import binascii
+import hmac
+import ipaddress
+import json
+import os
+import shlex
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+
+DEFAULT_ADDRESS = ('127.0.0.1', 7850)
+TOKEN_FILENAME = '.space_engineers_toolhost_token'
+
+_LENGTH = struct.Struct('>I')
+_EXITCODE = struct.Struct('>i')
+_ERROR = 0xFFFFFFFF
+
+class ToolHostError(OSError):
+    pass
+
+def parse_address(address: str) -> tuple:
+    host, sep, port = address.rpartition(':')
+    if not sep or not port.isdigit():
+        raise ValueError("expected host:port, got '%s'" % address)
+    return (host or DEFAULT_ADDRESS[0], int(port))
+
+def default_token_file() -> str:
+    return os.path.join(os.path.expanduser('~'), TOKEN_FILENAME)
+
+def read_token(tokenFile: str = None) -> str:
+    tokenFile = tokenFile or default_token_file()
+    try:
+        with open(tokenFile, 'r', encoding='ascii') as f:
+            return f.read().strip()
+    except (OSError, ValueError) as e:
+        raise ToolHostError("cannot read the token of the tool host from %s, has it been started yet? %s" % (tokenFile, e))
+
+def create_token(tokenFile: str = None) -> str:
+    """
+    Provides the token from tokenFile. Creates the file, readable only by its owner, with a new token if there is none.
+    """
+    tokenFile = tokenFile or default_token_file()
+    try:
+        fd = os.open(tokenFile, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return read_token(tokenFile)
+    token = binascii.hexlify(os.urandom(16)).decode('ascii')
+    with os.fdopen(fd, 'w', encoding='ascii') as f:
+        f.write(token)
+    return token
+
+def is_loopback(host: str) -> bool:
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except OSError:
+        return False
+    return bool(addresses) and all(ipaddress.ip_address(a.split('%', 1)[0]).is_loopback for a in addresses)
+
+def _recv_exactly(sock, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ToolHostError("the tool host closed the connection")
+        data += chunk
+    return data
+
+# ---------------------------------------------- client ---------------------------------------------- #
+
+class RemoteProcess:
+    """
+    A tool running in the tool host. Provides the part of subprocess.Popen's interface that
+    ExportSettings.callTool() uses: reading stdout line by line, wait() and kill().
+    """
+
+    def __init__(self, address: tuple, cmdline, cwd=None, connectTimeout=10.0, token: str = None):
+        self.cmdline = cmdline
+        self.returncode = None
+        token = token or read_token()
+        try:
+            self.sock = socket.create_connection(address, timeout=connectTimeout)
+            self.sock.settimeout(None)
+        except OSError as e:
+            raise ToolHostError("cannot reach the tool host at %s:%d: %s" % (address[0], address[1], e))
+        request = json.dumps({'token': token, 'cmdline': list(cmdline), 'cwd': cwd})
+        self.sock.sendall(request.encode('utf-8') + b"\n")
+        self.stdout = _RemoteOutput(self)
+
+    def _readFrame(self) -> bytes:
+        if self.returncode is not None:
+            return b''
+        try:
+            length, = _LENGTH.unpack(_recv_exactly(self.sock, _LENGTH.size))
+            if length == 0:
+                self.returncode, = _EXITCODE.unpack(_recv_exactly(self.sock, _EXITCODE.size))
+                return b''
+            if length == _ERROR:
+                length, = _LENGTH.unpack(_recv_exactly(self.sock, _LENGTH.size))
+                reason = _recv_exactly(self.sock, length).decode('utf-8', 'replace')
+            else:
+                return _recv_exactly(self.sock, length)
+        except OSError as e:
+            raise ToolHostError("lost the connection to the tool host while running %s: %s" % (self.cmdline[0], e))
+        self.close()
+        raise ToolHostError(reason)
+
+    def wait(self) -> int:
+        while self.returncode is None:
+            self._readFrame()
+        self.close()
+        return self.returncode
+
+    def kill(self):
+        try:
+            self.sock.shutdown(socket.SHUT_WR) # the host stops the tool and still sends its exit-code
+        except OSError:
+            pass
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+class _RemoteOutput:
+    def __init__(self, process: RemoteProcess):
+        self.process = process
+
+    def readline(self) -> bytes:
+        return self.process._readFrame()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+# ---------------------------------------------- host ---------------------------------------------- #
+
+def _send_error(sock, reason: str):
+    message = reason.encode('utf-8')
+    try:
+        sock.sendall(_LENGTH.pack(_ERROR) + _LENGTH.pack(len(message)) + message)
+    except OSError:
+        pass
+
+def _parse_request(line: bytes, token: str) -> tuple:
+    try:
+        request = json.loads(line.decode('utf-8'))
+    except ValueError:
+        raise ValueError("the request is not valid JSON")
+    if not isinstance(request, dict):
+        raise ValueError("the request is not a JSON object")
+    if not hmac.compare_digest(str(request.get('token', '')).encode('utf-8'), token.encode('utf-8')):
+        raise ValueError("the request does not carry the token of this tool host")
+    cmdline = request.get('cmdline', None)
+    if not isinstance(cmdline, list) or not cmdline or not all(isinstance(a, str) for a in cmdline):
+        raise ValueError("the request has no \"cmdline\" with a list of strings")
+    cwd = request.get('cwd', None)
+    if cwd is not None and not isinstance(cwd, str):
+        raise ValueError("the \"cwd\" of the request is not a string")
+    return cmdline, cwd
+
+class _ToolRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        reader = sock.makefile('rb')
+        try:
+            cmdline, cwd = _parse_request(reader.readline(), self.server.token)
+        except ValueError as e:
+            _send_error(sock, "rejected by the tool host: %s" % e)
+            return
+
+        cmdline = self.server.launcher + cmdline
+        try:
+            process = subprocess.Popen(cmdline, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError as e:
+            _send_error(sock, "the tool host cannot start %s: %s" % (cmdline[0], e))
+            return
+
+        def killOnHangup():
+            # nothing else is sent by the client, so any return from recv() means it gave up on the tool
+            try:
+                sock.recv(1)
+            except OSError:
+                pass
+            if process.poll() is None:
+                process.kill()
+        threading.Thread(target=killOnHangup, daemon=True).start()
+
+        try:
+            with process.stdout:
+                for line in iter(process.stdout.readline, b''):
+                    sock.sendall(_LENGTH.pack(len(line)) + line)
+            returncode = process.wait()
+            sock.sendall(_LENGTH.pack(0) + _EXITCODE.pack(returncode))
+        except OSError:
+            process.kill()
+            process.wait()
+
+class ToolHost(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple, token: str, launcher=None):
+        super().__init__(address, _ToolRequestHandler)
+        # requests must carry this, see create_token()
+        self.token = token
+        # prepended to every command-line, e.g. ['wine']
+        self.launcher = list(launcher) if launcher else []
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the external tools of the Space Engineers export on request.")
+    parser.add_argument('--listen', default='%s:%d' % DEFAULT_ADDRESS,
+                        help="host:port to listen on (default: %s:%d)" % DEFAULT_ADDRESS)
+    parser.add_argument('--launcher', default='', help="command prepended to each tool's command-line, e.g. \"wine\"")
+    parser.add_argument('--warmup', default='', help="command run once on start-up, e.g. \"wineserver --persistent\"")
+    parser.add_argument('--allow-remote', action='store_true',
+                        help="listen on an address other than loopback. anyone who gets hold of the token can run commands")
+    args = parser.parse_args(argv)
+
+    address = parse_address(args.listen)
+    if not args.allow_remote and not is_loopback(address[0]):
+        parser.error("%s is not a loopback-address, use --allow-remote if you really want to accept remote requests"
+                     % address[0])
+    token = create_token()
+
+    if args.warmup:
+        subprocess.call(shlex.split(args.warmup))
+
+    host = ToolHost(address, token, shlex.split(args.launcher))
+    print("toolhost: listening on %s:%d" % host.server_address[:2], flush=True)
+    try:
+        host.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        host.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+import time
+
+TRACE_FILENAME = 'export.trace.json'
+
+class Tracer:
+    """
+    Records how long the stages of an export take as complete events ("ph": "X") of Chrome's trace-event format.
+    The written file can be loaded into chrome://tracing or https://ui.perfetto.dev.
+    Spans can be recorded from any thread, each thread shows up as a lane of its own.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._threadIds = {}
+        # wall-clock timestamps line up the traces of several processes, perf_counter() measures precisely
+        self._epoch = time.time() - time.perf_counter()
+
+    def _tid(self) -> int:
+        ident = threading.get_ident()
+        tid = self._threadIds.get(ident, None)
+        if tid is None:
+            tid = self._threadIds[ident] = len(self._threadIds) + 1
+            self.events.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid,
+                'args': {'name': threading.current_thread().name},
+            })
+        return tid
+
+    def record(self, name: str, category: str, start: float, end: float, args: dict):
+        with self._lock:
+            self.events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': (self._epoch + start) * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': self._pid,
+                'tid': self._tid(),
+                'args': args,
+            })
+
+    def span(self, name: str, category: str, **args):
+        return _Span(self, name, category, args)
+
+    def write(self, filepath: str, events=None):
+        with self._lock:
+            events = list(self.events) + (list(events) if events else [])
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+class _Span:
+    def __init__(self, tracer: Tracer, name: str, category: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        args = self.args
+        if exc_type is not None:
+            args = dict(args, error=exc_type.__name__)
+        self.tracer.record(self.name, self.category, self.start, time.perf_counter(), args)
+
+class NullTracer:
+    """
+    Records nothing. Used unless tracing was asked for.
+    """
+
+    def span(self, name: str, category: str, **args):
+        return _NO_SPAN
+
+    def write(self, filepath: str, events=None):
+        pass
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+_NO_SPAN = _NoSpan()
+NULL_TRACER = NullTracer()
+
+def readTraceEvents(filepath: str) -> list:
+    """
+    Reads the events of a trace written by Tracer.write(). Missing or unreadable files provide no events.
+    """
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return json.load(f).get('traceEvents', [])
+    except (OSError, ValueError):
+        return []
@@ -9,7 +9,7 @@ from .pbr_node_group import firstMatching, createMaterialNodeTree, createDx11Sha
     getDx11ShaderGroup, getDx9ShaderGroup
 from .utils import data
 from .texture_files import TextureType, textureFileNameFromPath, _RE_DIFFUSE, \
-    matchingFileNamesFromFilePath, imageFromFilePath, imageNodes
+    matchingFileNamesFromFilePath, imageFromFilePath, imageNodes, invalidateImageIndex
 from .versions import versionsOnGitHub, Version
 from .utils import BoundingBox, layers, layer_bits, check_path, scene
 
@@ -112,6 +112,65 @@ class SEAddonPreferences(bpy.types.AddonPreferences):
         description='Locate hctStandAloneFilterManager.exe. Probably in C:\\Program Files\\Havok\\HavokContentTools\\',
     )
 
+    tool_processes = bpy.props.IntProperty(
+        name="Parallel Tool Processes",
+        min=1, max=64, default=4,
+        description="How many instances of MwmBuilder may run at the same time during an export",
+    )
+    tool_host = bpy.props.StringProperty(
+        name="Tool Host",
+        description="host:port of a running toolhost.py that starts the tools instead of the export itself. "
+                    "Saves the start-up time of a compatibility layer like Wine. Leave empty to start the tools directly",
+    )
+    mwmbuilder_batch_size = bpy.props.IntProperty(
+        name="MwmBuilder Batch Size",
+        min=1, max=64, default=1,
+        description="How many models of a block are converted by a single run of MwmBuilder. "
+                    "Starting MwmBuilder often takes longer than converting a model",
+    )
+    havok_timeout = bpy.props.IntProperty(
+        name="Havok Timeout",
+        min=0, default=0, subtype='TIME',
+        description="Seconds after which a hanging Havok tool is stopped. 0 waits forever",
+    )
+    mwmbuilder_timeout = bpy.props.IntProperty(
+        name="MwmBuilder Timeout",
+        min=0, default=0, subtype='TIME',
+        description="Seconds after which a hanging MwmBuilder is stopped, per model of a batch. 0 waits forever",
+    )
+    cache_dir = bpy.props.StringProperty(
+        name="Cache Directory",
+        subtype='DIR_PATH',
+        description="Where the export keeps files it can reuse later. Leave empty to use Blender's user data directory",
+    )
+    use_collision_cache = bpy.props.BoolProperty(
+        name="Share Collision Models",
+        default=True,
+        description="Reuse the Havok file of an identical collision model from an earlier export instead of converting it again",
+    )
+    use_tool_cache = bpy.props.BoolProperty(
+        name="Cache Tool Results",
+        default=False,
+        description="Remember the results of the Havok tools and MwmBuilder and reuse them when a tool is run with identical input files again",
+    )
+    max_cache_size = bpy.props.IntProperty(
+        name="Max. Cache Size (MB)",
+        min=0, default=2048,
+        description="The least recently used files are removed from the cache directory when it grows beyond this size. "
+                    "0 lets it grow without limit",
+    )
+    max_log_size = bpy.props.IntProperty(
+        name="Max. Log Size (MB)",
+        min=0, default=16,
+        description="Tool output beyond this size is not written to the log-files. 0 writes everything",
+    )
+    mesh_cache_size = bpy.props.IntProperty(
+        name="Mesh Cache (MB)",
+        min=0, default=512,
+        description="Memory for keeping objects with their modifiers applied during an export, "
+                    "so that they aren't evaluated again for each use. 0 evaluates them each time",
+    )
+
     def versions_enum(self, context):
         return [info[1] for info in versions.values()]
 
@@ -150,6 +209,25 @@ class SEAddonPreferences(bpy.types.AddonPreferences):
         col.prop(self, 'havokFilterMgr')
         col.alert = False
 
+        col = layout.column()
+        col.label(text="Export", icon="EXPORT")
+        row = col.row()
+        row.prop(self, 'tool_processes')
+        row.prop(self, 'mwmbuilder_batch_size')
+        row = col.row()
+        row.prop(self, 'havok_timeout')
+        row.prop(self, 'mwmbuilder_timeout')
+        row = col.row()
+        row.prop(self, 'max_log_size')
+        row.prop(self, 'mesh_cache_size')
+        row = col.row()
+        row.prop(self, 'cache_dir')
+        row.prop(self, 'max_cache_size')
+        col.prop(self, 'tool_host')
+        row = col.row()
+        row.prop(self, 'use_collision_cache')
+        row.prop(self, 'use_tool_cache')
+
         layout.separator()
 
         split = layout.split(percentage=0.42)
@@ -229,6 +307,9 @@ class SESceneProperties(bpy.types.PropertyGroup):
 
     block_size =  bpy.props.EnumProperty( items=BLOCK_SIZE, default='SCALE_DOWN', name="Block Size")
     block_dimensions = bpy.props.IntVectorProperty( default=(1,1,1), min=1, description="Block Dimensions", subtype="TRANSLATION")
+    use_large_fbx_for_small = bpy.props.BoolProperty( default=False, name="Reuse Large Model",
+        description="When scaling down, let MwmBuilder rescale the files exported for the large block instead of exporting them again. "
+                    "Models with scaled-down empties are still exported separately.")
 
     block_specular_power = bpy.props.FloatProperty( min=0.0, description="per block specular power", )
     block_specular_shininess = bpy.props.FloatProperty( min=0.0, description="per block specular shininess", )
@@ -245,6 +326,8 @@ class SESceneProperties(bpy.types.PropertyGroup):
                                 name="Construction Stages", description="Each layer in this set represents one construction stage. Only meshes and empties are included.")
 
     show_block_bounds = bpy.props.BoolProperty( default=True, name="Show Block Bounds", )
+    show_mount_points = bpy.props.BoolProperty( default=True, name="Show Mount Points",
+        description="Shows the mount-points as they would be exported on the block bounds" )
 
     use_custom_subtypeids = bpy.props.BoolProperty( default=False, name="Use custom SubtypeIds",
         description="This is only useful if you have to keep a specific block SubetypeId to remain backwards-compatible.")
@@ -316,6 +399,12 @@ class DATA_PT_spceng_scene(bpy.types.Panel):
         row = split.row(align=True)
         row.prop(spceng, "block_dimensions", text="")
         row.prop(spceng, "show_block_bounds", icon="MOD_MESHDEFORM", icon_only=True)
+        row.prop(spceng, "show_mount_points", icon="SNAP_FACE", icon_only=True)
+
+        if spceng.block_size == 'SCALE_DOWN':
+            row = layout.row()
+            row.alignment = 'RIGHT'
+            row.prop(spceng, 'use_large_fbx_for_small')
 
         row = layout.row()
         row.alignment = 'RIGHT'
@@ -430,6 +519,10 @@ def is_small_block():
 def show_block_bounds():
     d = data(scene())
     return d and d.is_block and d.show_block_bounds
+
+def show_mount_points():
+    d = data(scene())
+    return d and d.is_block and d.show_mount_points
          
 # -----------------------------------------  Object Data ----------------------------------------- #
  
@@ -798,11 +891,15 @@ def upgradeShadersAndMaterials(dummy):
 def register():
     if not syncTextureNodes in bpy.app.handlers.scene_update_pre:
         bpy.app.handlers.scene_update_pre.append(syncTextureNodes)
+    if not invalidateImageIndex in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.append(invalidateImageIndex)
     #if not upgradeShadersAndMaterials in bpy.app.handlers.load_post:
     #    bpy.app.handlers.load_post.append(upgradeShadersAndMaterials)
 
 def unregister():
     if syncTextureNodes in bpy.app.handlers.scene_update_pre:
         bpy.app.handlers.scene_update_pre.remove(syncTextureNodes)
+    if invalidateImageIndex in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(invalidateImageIndex)
     #if upgradeShadersAndMaterials in bpy.app.handlers.load_post:
     #    bpy.app.handlers.load_post.remove(upgradeShadersAndMaterials)